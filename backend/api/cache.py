@@ -0,0 +1,162 @@
+import time
+from array import array
+from collections import namedtuple
+from hashlib import md5
+
+from django.core.cache import caches
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+RECIPES_CACHE = 'recipes'
+MEMBERSHIPS_CACHE = 'memberships'
+MEMBERSHIP_SOURCES = (
+    (Favorite, 'recipe_id'),
+    (ShoppingCart, 'recipe_id'),
+    (Follow, 'author_id'),
+)
+
+Memberships = namedtuple(
+    'Memberships', ('favorites', 'shopping_cart', 'following')
+)
+EMPTY_MEMBERSHIPS = Memberships(frozenset(), frozenset(), frozenset())
+
+RECIPES_VERSION_KEY = 'recipes-list-version'
+# Параметры, от которых зависит страница списка рецептов.
+LIST_PARAMS = ('page', 'limit', 'cursor', 'tags', 'tags_mode', 'author',
+               'search')
+# Для анонимного пользователя эти фильтры ничего не меняют,
+# поэтому в ключ кэша они не попадают.
+IGNORED_PARAMS = ('is_favorited', 'is_in_shopping_cart', 'format')
+
+
+def get_recipes_cache():
+    return caches[RECIPES_CACHE]
+
+
+def get_recipes_version():
+    cache = get_recipes_cache()
+    version = cache.get(RECIPES_VERSION_KEY)
+    if version is None:
+        cache.add(RECIPES_VERSION_KEY, time.time(), timeout=None)
+        version = cache.get(RECIPES_VERSION_KEY)
+    return version
+
+
+def get_recipes_list_key(request):
+    """
+    Ключ кэша для страницы списка рецептов. В ключ входят только
+    параметры списка, отсортированные вместе со значениями, чтобы
+    ?tags=a&tags=b и ?tags=b&tags=a попадали в одну запись, и версия
+    кэша. Адрес сервера входит в ключ, так как в ответе есть
+    абсолютные ссылки на картинки и страницы.
+    """
+    params = sorted(
+        (key, sorted(values)) for key, values in request.GET.lists()
+        if key in LIST_PARAMS
+    )
+    raw = f'{request.build_absolute_uri("/")}{params}'
+    return (
+        f'recipes-list:{get_recipes_version()}:'
+        f'{md5(raw.encode()).hexdigest()}'
+    )
+
+
+def is_cacheable(request):
+    """
+    Ссылки на соседние страницы в ответе строятся из адреса запроса,
+    поэтому ответ на запрос с посторонними параметрами не сохраняется:
+    иначе эти параметры попали бы в ссылки для всех.
+    """
+    return all(
+        key in LIST_PARAMS or key in IGNORED_PARAMS for key in request.GET
+    )
+
+
+def bump_recipes_version():
+    get_recipes_cache().set(RECIPES_VERSION_KEY, time.time(), timeout=None)
+
+
+def clear_recipes_cache(**kwargs):
+    """
+    Меняет версию кэша страниц списка рецептов после фиксации
+    транзакции, чтобы параллельный запрос не успел снова закэшировать
+    старые данные. Прежние страницы больше не читаются и удаляются
+    по истечении срока, остальные ключи общего кэша не трогаются.
+    Подключается к сигналам моделей.
+    """
+    transaction.on_commit(bump_recipes_version)
+
+
+def get_memberships_version_key(user_id):
+    return f'memberships-version:{user_id}'
+
+
+def get_memberships_key(user_id, version):
+    """
+    Множества лежат под ключом с версией, поэтому запрос, прочитавший
+    базу до их изменения, не может записать старые данные
+    под новую версию.
+    """
+    return f'memberships:{user_id}:{version}'
+
+
+def get_memberships_version(user_id):
+    cache = caches[MEMBERSHIPS_CACHE]
+    version_key = get_memberships_version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time())
+        version = cache.get(version_key)
+    return version
+
+
+def load_memberships(user_id):
+    cache = caches[MEMBERSHIPS_CACHE]
+    key = get_memberships_key(user_id, get_memberships_version(user_id))
+    stored = cache.get(key)
+    if stored is None:
+        # Множества хранятся отсортированными массивами чисел:
+        # так они занимают в кэше в несколько раз меньше места.
+        stored = [
+            array('q', sorted(model.objects.filter(
+                user_id=user_id
+            ).values_list(field, flat=True)))
+            for model, field in MEMBERSHIP_SOURCES
+        ]
+        cache.set(key, stored)
+    return Memberships(*(frozenset(ids) for ids in stored))
+
+
+def get_memberships(request):
+    """
+    Id рецептов в избранном и в корзине текущего пользователя и id
+    авторов, на которых он подписан. Множества читаются из кэша один
+    раз за запрос, из базы - только после их изменения.
+    """
+    if request is None or request.user.is_anonymous:
+        return EMPTY_MEMBERSHIPS
+    memberships = getattr(request, 'memberships', None)
+    if memberships is None:
+        memberships = request.memberships = load_memberships(
+            request.user.id
+        )
+    return memberships
+
+
+def bump_memberships(instance, **kwargs):
+    """
+    Меняет версию множеств пользователя после фиксации транзакции
+    и удаляет их прежнюю копию. Подключается к сигналам избранного,
+    корзины и подписок.
+    """
+    def bump():
+        cache = caches[MEMBERSHIPS_CACHE]
+        version_key = get_memberships_version_key(instance.user_id)
+        version = cache.get(version_key)
+        cache.set(version_key, time.time())
+        if version is not None:
+            cache.delete(get_memberships_key(instance.user_id, version))
+
+    transaction.on_commit(bump)
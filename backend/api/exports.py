@@ -0,0 +1,102 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import APISettings
+
+from recipes.models import ShoppingListItem
+
+TITLE = 'Список ингредиентов'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+# Сколько строк списка покупок читается из курсора за раз.
+READ_CHUNK_SIZE = 500
+
+
+def get_shopping_list(user):
+    """
+    Возвращает суммарное количество каждого ингредиента из рецептов,
+    добавленных пользователем в список покупок. Итоги заранее посчитаны
+    в ShoppingListItem, поэтому это простое чтение по индексу.
+    """
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+
+
+def format_item(number, item):
+    """
+    Строка списка покупок, одинаковая в PDF и в текстовом файле.
+    """
+    return (
+        f'<{number}> {item["ingredient__name"]} - {item["amount"]}, '
+        f'{item["ingredient__measurement_unit"]}'
+    )
+
+
+class Echo:
+    """
+    Файловый объект для csv.writer, который возвращает строку
+    вместо записи, чтобы ее можно было сразу отдать клиенту.
+    """
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    yield f'{TITLE}\n\n'
+    for number, item in enumerate(items, 1):
+        yield format_item(number, item) + '\n'
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'], item['amount'],
+            item['ingredient__measurement_unit'],
+        ))
+
+
+def render_json(items):
+    yield '['
+    for number, item in enumerate(items):
+        yield (',' if number else '') + json.dumps({
+            'name': item['ingredient__name'],
+            'amount': item['amount'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+    yield ']'
+
+
+EXPORT_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
+
+
+def stream_shopping_list(user, export_format):
+    """
+    Отдает список покупок файлом в формате txt, csv или json.
+    Строки читаются из курсора пачками и сразу уходят клиенту,
+    весь список в памяти не собирается.
+    """
+    render, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        render(get_shopping_list(user).iterator(chunk_size=READ_CHUNK_SIZE)),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"'
+    )
+    return response
+
+
+class FileFormatNegotiation(DefaultContentNegotiation):
+    """
+    Параметр format здесь выбирает формат файла, а не рендерер DRF,
+    поэтому подмена формата ответа через URL отключена.
+    """
+    settings = APISettings({'URL_FORMAT_OVERRIDE': None})
@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+
+class RecipeImageField(serializers.ImageField):
+    """
+    Ссылка на уменьшенную копию картинки рецепта. Пока копия
+    не готова, отдается ссылка на оригинал.
+    """
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        image = getattr(recipe, f'image_{self.variant}') or recipe.image
+        return super().to_representation(image)
@@ -1,7 +1,25 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
+from recipes.catalog import tags_catalog
 from recipes.models import Recipe
+from recipes.search import search_recipes
+
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODES = (
+    (TAGS_MODE_ANY, 'Хотя бы один из тегов'),
+    (TAGS_MODE_ALL, 'Все теги'),
+)
+
+
+def get_tag_choices():
+    return [
+        (tag['slug'], tag['name'])
+        for tag in map(tags_catalog.as_dict, tags_catalog.load().rows)
+    ]
 
 
 class IngredientSearchFilter(SearchFilter):
@@ -10,14 +28,56 @@ class IngredientSearchFilter(SearchFilter):
 
 class RecipeFilter(FilterSet):
     """
-    Фильтр для рецептов. По тэгам, избранному и списку покупок.
+    Фильтр для рецептов. По тэгам, избранному, списку покупок
+    и полнотекстовый поиск по названию и описанию.
     """
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='get_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method='get_tags_mode'
+    )
+    search = filters.CharFilter(method='get_search')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
 
+    def get_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов, а с tags_mode=all - со всеми
+        тегами. Id тегов берутся из справочника в памяти, а условие
+        строится через EXISTS по таблице связей вместо JOIN и DISTINCT:
+        рецепт с несколькими подходящими тегами попадает в выдачу один
+        раз, а база идет по индексу даты публикации и проверяет теги
+        каждого рецепта по индексу (recipe_id, tag_id), пока не наберет
+        страницу. Для всех тегов проверяется свой EXISTS на каждый тег.
+        """
+        if not value:
+            return queryset
+        slugs = set(value)
+        tag_ids = [
+            tag['id']
+            for tag in map(tags_catalog.as_dict, tags_catalog.load().rows)
+            if tag['slug'] in slugs
+        ]
+        links = Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_mode') != TAGS_MODE_ALL:
+            return queryset.annotate(has_tags=Exists(
+                links.filter(tag_id__in=tag_ids)
+            )).filter(has_tags=True)
+        conditions = {
+            f'has_tag_{tag_id}': Exists(links.filter(tag_id=tag_id))
+            for tag_id in tag_ids
+        }
+        return queryset.annotate(**conditions).filter(
+            **dict.fromkeys(conditions, True)
+        )
+
+    def get_tags_mode(self, queryset, name, value):
+        # Режим применяется в get_tags, сам по себе выдачу не меняет.
+        return queryset
+
     def get_is_favorited(self, queryset, value, name):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(favorites__user=self.request.user)
@@ -28,6 +88,17 @@ class RecipeFilter(FilterSet):
             return queryset.filter(carts__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        """
+        Найденные рецепты выводятся по релевантности,
+        при равной релевантности - сначала новые.
+        """
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value).order_by(
+            '-rank', '-pub_date', '-id'
+        )
+
     class Meta:
         model = Recipe
         fields = ('author', 'tags',)
@@ -0,0 +1,132 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from uuid import uuid4
+
+from django.core.files import File
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from foodgram.settings import SHOPPING_LIST_WORKERS
+from recipes.models import ShoppingListJob
+from .utils import SPOOL_MAX_SIZE, render_shopping_list
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=SHOPPING_LIST_WORKERS, thread_name_prefix='shopping-lists'
+)
+
+
+def claim_job():
+    """
+    Забирает из очереди самую старую задачу. Строки, заблокированные
+    другими обработчиками, пропускаются, поэтому одну задачу
+    не выполнят дважды.
+    """
+    with transaction.atomic():
+        job = ShoppingListJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            status=ShoppingListJob.PENDING
+        ).order_by('created').first()
+        if job is None:
+            return None
+        job.status = ShoppingListJob.RUNNING
+        job.started = timezone.now()
+        job.save(update_fields=('status', 'started'))
+    return job
+
+
+def run_job(job):
+    try:
+        buffer = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        render_shopping_list(job.user, buffer)
+        buffer.seek(0)
+        job.file.save(f'{uuid4().hex}.pdf', File(buffer), save=False)
+        job.status = ShoppingListJob.DONE
+    except Exception as error:
+        logger.exception('Не удалось подготовить список покупок %s', job.pk)
+        job.status = ShoppingListJob.FAILED
+        job.error = str(error)
+    job.finished = timezone.now()
+    job.save(update_fields=('status', 'file', 'error', 'finished'))
+
+
+def run_pending_jobs():
+    """
+    Выполняет задачи, пока очередь не опустеет.
+    Возвращает количество выполненных задач.
+    """
+    done = 0
+    job = claim_job()
+    while job is not None:
+        run_job(job)
+        done += 1
+        job = claim_job()
+    return done
+
+
+def run_pending_jobs_in_thread():
+    try:
+        run_pending_jobs()
+    except Exception:
+        logger.exception('Сбой обработчика очереди списков покупок')
+    finally:
+        connections.close_all()
+
+
+def get_active_job(user):
+    return ShoppingListJob.objects.filter(
+        user=user,
+        status__in=(ShoppingListJob.PENDING, ShoppingListJob.RUNNING),
+    ).first()
+
+
+def enqueue_job(user):
+    """
+    Ставит в очередь задачу на список покупок пользователя. Если
+    у пользователя уже есть невыполненная задача, возвращается она.
+    """
+    job = get_active_job(user)
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            job = ShoppingListJob.objects.create(user=user)
+    except IntegrityError:
+        # Задачу успел поставить параллельный запрос того же
+        # пользователя: второй такой задачи не дает ограничение.
+        return get_active_job(user)
+    transaction.on_commit(
+        lambda: executor.submit(run_pending_jobs_in_thread)
+    )
+    return job
+
+
+def requeue_stale_jobs(minutes):
+    """
+    Возвращает в очередь задачи, зависшие в статусе «Выполняется»
+    (например, если процесс был остановлен во время работы).
+    """
+    return ShoppingListJob.objects.filter(
+        status=ShoppingListJob.RUNNING,
+        started__lt=timezone.now() - timedelta(minutes=minutes),
+    ).update(status=ShoppingListJob.PENDING, started=None)
+
+
+def delete_old_jobs(hours):
+    """
+    Удаляет завершенные задачи старше указанного срока вместе с файлами.
+    """
+    jobs = ShoppingListJob.objects.filter(
+        status__in=(ShoppingListJob.DONE, ShoppingListJob.FAILED),
+        finished__lt=timezone.now() - timedelta(hours=hours),
+    )
+    deleted = 0
+    for job in jobs.iterator():
+        job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
@@ -0,0 +1,199 @@
+import base64
+import json
+from io import BytesIO
+from statistics import mean, median
+from time import perf_counter
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from foodgram.settings import ALLOWED_HOSTS
+from recipes.management.benchmarks import percentile
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import CustomUser, Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер API через тестовый клиент Django: список '
+        'рецептов с фильтрами, подписки, выгрузка списка покупок '
+        'и создание рецепта. Результат - JSON с перцентилями времени '
+        'ответа и числом SQL-запросов, который удобно сравнивать '
+        'между коммитами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько раз выполнить каждый сценарий.',
+        )
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Логин пользователя, от имени которого идут запросы. '
+                 'По умолчанию - пользователь с наибольшим числом подписок.',
+        )
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Выполнить только указанные сценарии.',
+        )
+        parser.add_argument('--output', help='Файл для JSON-отчета.')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        host = next((name for name in ALLOWED_HOSTS if name != '*'), None)
+        self.client = Client(
+            HTTP_AUTHORIZATION=f'Token {self.get_token(user)}',
+            HTTP_HOST=host or 'localhost',
+        )
+        scenarios = self.get_scenarios(user)
+        if options['scenario']:
+            scenarios = {
+                name: request for name, request in scenarios.items()
+                if name in options['scenario']
+            }
+        report = {
+            'environment': self.get_environment(),
+            'scenarios': {
+                name: self.measure(
+                    request, options['requests'], options['warmup']
+                )
+                for name, request in scenarios.items()
+            },
+        }
+        result = json.dumps(report, ensure_ascii=False, indent=2,
+                            sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(result + '\n')
+        self.stdout.write(result)
+
+    @staticmethod
+    def get_user(username):
+        if username:
+            user = CustomUser.objects.filter(username=username).first()
+        else:
+            user = CustomUser.objects.annotate(
+                follows=Count('follower')
+            ).order_by('-follows', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден, заполните базу командой '
+                'generate_dataset.'
+            )
+        return user
+
+    @staticmethod
+    def get_token(user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return token.key
+
+    @staticmethod
+    def get_environment():
+        return {
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': CustomUser.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'follows': Follow.objects.count(),
+            'favorites': Favorite.objects.count(),
+            'carts': ShoppingCart.objects.count(),
+        }
+
+    def get_scenarios(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        tag_query = '&'.join(f'tags={slug}' for slug in tags)
+        recipe, author = Recipe.objects.values_list('id', 'author_id')[0]
+        get = self.client.get
+        return {
+            'recipes-list': lambda: get('/api/recipes/'),
+            'recipes-list-page-10': lambda: get('/api/recipes/?page=10'),
+            'recipes-list-tags': lambda: get(f'/api/recipes/?{tag_query}'),
+            'recipes-list-tags-all': lambda: get(
+                f'/api/recipes/?{tag_query}&tags_mode=all'
+            ),
+            'recipes-list-author': lambda: get(
+                f'/api/recipes/?author={author}'
+            ),
+            'recipes-list-favorited': lambda: get(
+                '/api/recipes/?is_favorited=1'
+            ),
+            'recipes-list-in-cart': lambda: get(
+                '/api/recipes/?is_in_shopping_cart=1'
+            ),
+            'recipes-detail': lambda: get(f'/api/recipes/{recipe}/'),
+            'users-subscriptions': lambda: get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'recipes-download-shopping-cart': lambda: get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'recipes-create': self.create_recipe,
+        }
+
+    def create_recipe(self):
+        """
+        Создает рецепт и откатывает транзакцию, чтобы повторные
+        замеры шли на одних и тех же данных.
+        """
+        if not hasattr(self, 'recipe_data'):
+            self.recipe_data = self.get_recipe_data()
+        with transaction.atomic():
+            response = self.client.post(
+                '/api/recipes/', self.recipe_data,
+                content_type='application/json',
+            )
+            if response.status_code == 201:
+                image = Recipe.objects.get(id=response.json()['id']).image
+                default_storage.delete(image.name)
+            transaction.set_rollback(True)
+        return response
+
+    @staticmethod
+    def get_recipe_data():
+        content = BytesIO()
+        Image.new('RGB', (600, 400), (120, 180, 90)).save(content, 'JPEG')
+        image = base64.b64encode(content.getvalue()).decode()
+        ingredients = Ingredient.objects.values_list('id', flat=True)[:10]
+        return {
+            'name': 'Замер создания рецепта',
+            'text': 'Рецепт создается и сразу удаляется.',
+            'cooking_time': 30,
+            'image': f'data:image/jpeg;base64,{image}',
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': ingredient, 'amount': 100} for ingredient in ingredients
+            ],
+        }
+
+    @staticmethod
+    def measure(request, count, warmup):
+        for _ in range(warmup):
+            request()
+        timings, queries, statuses = [], [], set()
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as context:
+                started = perf_counter()
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        return {
+            'status': sorted(statuses),
+            'requests': count,
+            'mean_ms': round(mean(timings), 2),
+            'p50_ms': round(median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': median(queries),
+            'queries_max': max(queries),
+        }
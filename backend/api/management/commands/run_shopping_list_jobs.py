@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import delete_old_jobs, requeue_stale_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Обработчик очереди задач на PDF со списками покупок. Дополняет '
+        'фоновые потоки веб-процессов и подбирает зависшие задачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь один раз и завершиться.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Пауза между проверками очереди, в секундах.',
+        )
+        parser.add_argument(
+            '--stale-minutes', type=int, default=10,
+            help='Через сколько минут вернуть зависшую задачу в очередь.',
+        )
+        parser.add_argument(
+            '--keep-hours', type=int, default=24,
+            help='Сколько часов хранить готовые файлы.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs(options['stale_minutes'])
+            done = run_pending_jobs()
+            deleted = delete_old_jobs(options['keep_hours'])
+            if requeued or done or deleted:
+                self.stdout.write(
+                    f'Возвращено в очередь: {requeued}, выполнено: {done}, '
+                    f'удалено: {deleted}.'
+                )
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,241 @@
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from rest_framework import serializers
+
+from foodgram.settings import METRICS_FLUSH_INTERVAL
+
+METRICS_CACHE = 'metrics'
+PROCESSES_KEY = 'metrics-processes'
+# Снимок процесса, который давно не обновлялся, считается остановленным.
+SNAPSHOT_TIMEOUT = 60 * 60
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+HISTOGRAMS = (
+    ('request_duration_seconds', 'Время обработки запроса.', TIME_BUCKETS),
+    ('db_duration_seconds', 'Время SQL-запросов.', TIME_BUCKETS),
+    ('serializer_duration_seconds', 'Время сериализации.', TIME_BUCKETS),
+    ('db_queries', 'Количество SQL-запросов.', QUERY_BUCKETS),
+)
+PREFIX = 'foodgram_'
+
+local = threading.local()
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса: число и время SQL-запросов и время
+    сериализации. Собирается обертками вокруг курсора и сериализаторов.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+def get_current():
+    return getattr(local, 'metrics', None)
+
+
+@contextmanager
+def collect(metrics=None):
+    local.metrics = metrics or RequestMetrics()
+    try:
+        yield local.metrics
+    finally:
+        local.metrics = None
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Учитывает время сериализации. Вложенные сериализаторы (например,
+    рецепты внутри подписки) входят во время внешнего и повторно
+    не считаются.
+    """
+    metrics = get_current()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if not metrics.serializer_depth:
+            metrics.serializer_time += time.perf_counter() - started
+
+
+def timed_data(prop):
+    def data(self):
+        with serializer_timer():
+            return prop.fget(self)
+    return property(data)
+
+
+def instrument_serializers():
+    """
+    Оборачивает свойство data сериализаторов DRF: через него проходят
+    все ответы API, поэтому отдельные сериализаторы менять не нужно.
+    """
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'timed', False):
+            cls.data = timed_data(cls.data)
+            cls.data.fget.timed = True
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, counts, total):
+        for number, count in enumerate(counts):
+            self.counts[number] += count
+        self.sum += total
+
+
+class Registry:
+    """
+    Гистограммы по имени представления и методу в памяти процесса.
+    Раз в METRICS_FLUSH_INTERVAL секунд процесс сохраняет снимок
+    в общий кэш, а /api/metrics/ складывает снимки всех процессов.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed = time.monotonic()
+
+    @property
+    def key(self):
+        # Процесс определяется при каждом обращении: воркеры gunicorn
+        # создаются через fork уже после импорта модуля.
+        return f'metrics:{socket.gethostname()}:{os.getpid()}'
+
+    def get_series(self, labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [
+                Histogram(buckets) for _, _, buckets in HISTOGRAMS
+            ]
+        return series
+
+    def observe(self, labels, values):
+        with self.lock:
+            for histogram, value in zip(self.get_series(labels), values):
+                histogram.observe(value)
+            flush = time.monotonic() - self.flushed >= METRICS_FLUSH_INTERVAL
+            if flush:
+                self.flushed = time.monotonic()
+        if flush:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                (labels, [(h.counts[:], h.sum) for h in series])
+                for labels, series in self.series.items()
+            ]
+
+    def flush(self):
+        cache = caches[METRICS_CACHE]
+        cache.set(self.key, self.snapshot(), SNAPSHOT_TIMEOUT)
+        processes = cache.get(PROCESSES_KEY, ())
+        if self.key not in processes:
+            processes = [*processes, self.key]
+            cache.set(PROCESSES_KEY, processes, None)
+
+    def collect(self):
+        """
+        Складывает снимки всех живых процессов. Снимки остановленных
+        процессов со временем удаляются из кэша и из списка.
+        """
+        self.flush()
+        cache = caches[METRICS_CACHE]
+        processes = cache.get(PROCESSES_KEY, ())
+        snapshots = cache.get_many(processes)
+        if len(snapshots) != len(processes):
+            cache.set(PROCESSES_KEY, list(snapshots), None)
+        merged = {}
+        for snapshot in snapshots.values():
+            for labels, values in snapshot:
+                series = merged.get(labels)
+                if series is None:
+                    series = merged[labels] = [
+                        Histogram(buckets) for _, _, buckets in HISTOGRAMS
+                    ]
+                for histogram, (counts, total) in zip(series, values):
+                    histogram.merge(counts, total)
+        return merged
+
+
+def escape_label(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def format_labels(labels, **extra):
+    view, method = labels
+    pairs = [('view', view), ('method', method), *extra.items()]
+    return ','.join(
+        f'{name}="{escape_label(value)}"' for name, value in pairs
+    )
+
+
+def render(merged):
+    """
+    Возвращает гистограммы в текстовом формате Prometheus.
+    """
+    lines = []
+    for number, (name, description, buckets) in enumerate(HISTOGRAMS):
+        name = PREFIX + name
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, series in sorted(merged.items()):
+            histogram = series[number]
+            count = 0
+            for bound, bucket_count in zip(
+                (*buckets, '+Inf'), histogram.counts
+            ):
+                count += bucket_count
+                lines.append(
+                    f'{name}_bucket{{{format_labels(labels, le=bound)}}} '
+                    f'{count}'
+                )
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} '
+                         f'{histogram.sum:.6f}')
+            lines.append(f'{name}_count{{{format_labels(labels)}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
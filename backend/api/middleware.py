@@ -0,0 +1,84 @@
+from django.db import connection
+
+from .metrics import collect, registry
+
+UNRESOLVED = 'unresolved'
+STAFF_HEADER = 'Server-Timing'
+# Прочие методы попадают в одну метку, чтобы произвольные значения
+# из запросов не плодили ряды метрик.
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+OTHER_METHOD = 'other'
+
+
+class MetricsMiddleware:
+    """
+    Замеряет каждый запрос: число и время SQL-запросов, время
+    сериализации и общее время ответа. Значения попадают
+    в гистограммы по имени представления (recipes-list,
+    users-subscriptions), а администраторам возвращаются
+    в заголовке Server-Timing.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect() as metrics:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        labels = (self.get_view_name(request), self.get_method(request))
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, metrics, labels
+            )
+            return response
+        total = metrics.total
+        self.observe(labels, metrics, total)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response[STAFF_HEADER] = (
+                f'db;dur={metrics.db_time * 1000:.1f};'
+                f'desc="{metrics.queries} SQL", '
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}'
+            )
+        return response
+
+    def measure_stream(self, content, metrics, labels):
+        """
+        Потоковые ответы (выгрузка списка покупок) читают базу уже
+        после возврата из представления, поэтому запросы учитываются
+        при получении каждого куска, а замер сохраняется, когда
+        ответ отдан или закрыт. Заголовок Server-Timing к этому
+        времени уже отправлен, и таким ответам он не добавляется.
+        """
+        chunks = iter(content)
+        try:
+            while True:
+                with collect(metrics):
+                    with connection.execute_wrapper(metrics):
+                        chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.observe(labels, metrics, metrics.total)
+
+    @staticmethod
+    def observe(labels, metrics, total):
+        registry.observe(
+            labels,
+            (total, metrics.db_time, metrics.serializer_time, metrics.queries)
+        )
+
+    @staticmethod
+    def get_method(request):
+        if request.method in METHODS:
+            return request.method
+        return OTHER_METHOD
+
+    @staticmethod
+    def get_view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return UNRESOLVED
+        return match.view_name
@@ -1,5 +1,8 @@
+from django.utils.crypto import constant_time_compare
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from foodgram.settings import METRICS_TOKEN
+
 
 class IsOwnerOrReadOnly(BasePermission):
     """
@@ -17,3 +20,17 @@ class IsAdminOrReadOnly(BasePermission):
     """
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS or request.user.is_staff
+
+
+class IsAdminOrMetricsToken(BasePermission):
+    """
+    Разрешает просмотр метрик администратору, а также сборщику метрик,
+    передавшему заголовок Authorization: Bearer <METRICS_TOKEN>.
+    """
+    def has_permission(self, request, view):
+        if request.user.is_staff:
+            return True
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(METRICS_TOKEN) and constant_time_compare(
+            header, f'Bearer {METRICS_TOKEN}'
+        )
@@ -1,10 +1,15 @@
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.http import Http404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, ShoppingListJob,
+                            Tag)
 from users.serializers import CustomUserSerializer
+from .cache import get_memberships
+from .fields import RecipeImageField
 
 
 class SimplifyRecipeSerializer(serializers.ModelSerializer):
@@ -13,7 +18,7 @@ class SimplifyRecipeSerializer(serializers.ModelSerializer):
     краткого отображения сведений о рецептах пользователей,
     на которых подписан текущий пользователь.
     """
-    image = Base64ImageField()
+    image = RecipeImageField('card')
 
     class Meta:
         model = Recipe
@@ -60,6 +65,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True,)
     author = CustomUserSerializer(read_only=True,)
     image = Base64ImageField()
+    image_card = RecipeImageField('card')
+    image_detail = RecipeImageField('detail')
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -75,98 +82,129 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_card',
+            'image_detail',
             'text',
             'cooking_time',
         )
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Recipe.objects.filter(carts__user=user, id=obj.id).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return obj.id in memberships.shopping_cart
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Recipe.objects.filter(favorites__user=user, id=obj.id).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return obj.id in memberships.favorites
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
-        ingredients_data = validated_data.pop('ingredients')
+        amounts = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(author=author, **validated_data)
-        for tag in tags:
-            recipe.tags.add(tag)
-        for ingredient in ingredients_data:
-            IngredientAmount.objects.create(
-                recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'),
+        recipe.tags.add(*tags)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in amounts.items()
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """
+        Обновляет только изменившиеся теги и количества ингредиентов
+        вместо удаления и повторной вставки всех связей рецепта.
+        """
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.image = validated_data.get('image', instance.image)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        instance.tags.clear()
-        tags_data = self.initial_data.get('tags')
-        instance.tags.set(tags_data)
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        ingredients_data = validated_data.pop('ingredients')
-        for ingredient in ingredients_data:
-            IngredientAmount.objects.create(
-                recipe=instance,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'),
+        instance.tags.set(validated_data.pop('tags'))
+        old_amounts = ShoppingListItem.objects.get_recipe_amounts(instance.id)
+        new_amounts = validated_data.pop('ingredients')
+        with ShoppingListItem.objects.batch():
+            removed = old_amounts.keys() - new_amounts.keys()
+            if removed:
+                IngredientAmount.objects.filter(
+                    recipe=instance, ingredient_id__in=removed
+                ).delete()
+            changed = {
+                ingredient_id: amount
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id in old_amounts
+                and old_amounts[ingredient_id] != amount
+            }
+            if changed:
+                IngredientAmount.objects.filter(
+                    recipe=instance, ingredient_id__in=changed
+                ).update(amount=Case(
+                    *(When(ingredient_id=ingredient_id, then=Value(amount))
+                      for ingredient_id, amount in changed.items()),
+                    output_field=IntegerField(),
+                ))
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=instance, ingredient_id=ingredient_id, amount=amount
+                )
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in old_amounts
             )
+            # Удаленные ингредиенты вычитают из списков покупок сигналы,
+            # update и bulk_create сигналов не отправляют.
+            ShoppingListItem.objects.change_recipe(instance.id, {
+                ingredient_id: amount
+                for ingredient_id, amount in old_amounts.items()
+                if ingredient_id in new_amounts
+            }, new_amounts)
         instance.save()
         return instance
 
     def validate(self, data):
+        """
+        Проверяет теги и ингредиенты рецепта. Существование всех
+        тегов и всех ингредиентов проверяется одним запросом на модель.
+        Ингредиенты возвращаются словарем «ингредиент: количество».
+        """
         tags = self.initial_data.get('tags')
         if not tags:
             raise serializers.ValidationError(
                 {'tags': 'Нужно добавить хотя бы один тэг для рецепта'}
             )
-        tags_list = []
-        for item in tags:
-            tag = get_object_or_404(
-                Tag, id=item
+        tags = [int(item) for item in tags]
+        if len(set(tags)) != len(tags):
+            raise serializers.ValidationError(
+                {'tags': 'Теги для рецепта не могут повторяться'}
             )
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    {'tags': 'Теги для рецепта не могут повторяться'}
-                )
-            tags_list.append(tag)
+        if Tag.objects.filter(id__in=tags).count() != len(tags):
+            raise Http404
         data['tags'] = tags
         ingredients = self.initial_data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredients': 'Не может быть рецепта без ингрединтов.'}
             )
-        ingredients_list = []
+        amounts = {}
         for item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=item['id']
-            )
-            if ingredient in ingredients_list:
+            ingredient_id = int(item['id'])
+            if ingredient_id in amounts:
                 raise serializers.ValidationError(
                     'Ингридиенты для рецепта не могут повторяться.'
                 )
-            if int(item['amount']) < 1:
+            amounts[ingredient_id] = int(item['amount'])
+            if amounts[ingredient_id] < 1:
                 raise serializers.ValidationError(
                     'Колличество ингридиента не может быть менее 1.'
                 )
-            ingredients_list.append(ingredient)
-        data['ingredients'] = ingredients
+        if Ingredient.objects.filter(id__in=amounts).count() != len(amounts):
+            raise Http404
+        data['ingredients'] = amounts
         return data
 
     def get_ingredients(self, obj):
-        queryset = IngredientAmount.objects.filter(recipe=obj)
+        queryset = obj.amounts.all()
         return IngredientAmountSerializer(queryset, many=True).data
 
 
@@ -200,3 +238,13 @@ class FavoriteSerializer(serializers.ModelSerializer):
             return SimplifyRecipeSerializer(
                 instance=instance.recipe, context=context
             ).data
+
+
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для статуса задачи на PDF со списком покупок.
+    """
+    class Meta:
+        model = ShoppingListJob
+        fields = ('id', 'status', 'file', 'error', 'created', 'finished')
+        read_only_fields = fields
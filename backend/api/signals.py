@@ -0,0 +1,36 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from users.models import CustomUser
+from .cache import MEMBERSHIP_SOURCES, bump_memberships, clear_recipes_cache
+
+RECIPE_LIST_MODELS = (
+    Recipe, IngredientAmount, Tag, Ingredient, Recipe.tags.through,
+)
+# Поля автора, которые выводятся в каждом рецепте списка.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+for model in RECIPE_LIST_MODELS:
+    post_save.connect(clear_recipes_cache, sender=model)
+    post_delete.connect(clear_recipes_cache, sender=model)
+m2m_changed.connect(clear_recipes_cache, sender=Recipe.tags.through)
+post_delete.connect(clear_recipes_cache, sender=CustomUser)
+
+for model, _ in MEMBERSHIP_SOURCES:
+    post_save.connect(bump_memberships, sender=model)
+    post_delete.connect(bump_memberships, sender=model)
+
+
+@receiver(post_save, sender=CustomUser)
+def clear_recipes_cache_on_author_change(instance, created, raw,
+                                         update_fields=None, **kwargs):
+    """
+    Данные автора выводятся в каждом рецепте. У нового пользователя
+    рецептов еще нет, а вход, смена пароля и счетчики выведенных
+    полей не меняют.
+    """
+    if created and not raw:
+        return
+    if instance.get_changed_fields(AUTHOR_FIELDS, update_fields):
+        clear_recipes_cache()
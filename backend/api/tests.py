@@ -0,0 +1,842 @@
+import base64
+import csv
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import jobs
+from api.metrics import HISTOGRAMS, format_labels, registry
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, ShoppingListItem,
+                            ShoppingListJob, Tag)
+from recipes.search import search_recipes
+from users.authentication import get_version, token_cache
+from users.models import CustomUser, Follow
+
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias}
+    for alias in ('default', 'recipes', 'catalog', 'metrics', 'memberships')
+}
+
+
+class CacheTestCase(TestCase):
+    """
+    Кэши в памяти процесса живут между тестами, поэтому перед
+    каждым тестом они очищаются.
+    """
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        token_cache.clear()
+
+
+def create_user(number):
+    return CustomUser.objects.create_user(
+        email=f'user{number}@example.com', username=f'user{number}',
+        first_name='Имя', last_name='Фамилия', password='test-password',
+    )
+
+
+def create_catalog(tags=3, ingredients=30):
+    return (
+        [Tag.objects.create(name=f'Тег {number}', color=f'#0000{number:02}',
+                            slug=f'tag{number}')
+         for number in range(tags)],
+        [Ingredient.objects.create(name=f'Ингредиент {number}',
+                                   measurement_unit='г')
+         for number in range(ingredients)],
+    )
+
+
+def create_recipe(author, tags, ingredients, name='Рецепт'):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Описание', cooking_time=10,
+        image='recipes/test.png',
+    )
+    recipe.tags.set(tags)
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(recipe=recipe, ingredient=ingredient, amount=10)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListQueriesTest(CacheTestCase):
+    """
+    Число запросов списка рецептов не зависит от размера страницы.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        tags, ingredients = create_catalog()
+        authors = [create_user(number) for number in range(5)]
+        cls.user = authors[0]
+        for number in range(60):
+            recipe = create_recipe(
+                authors[number % len(authors)],
+                tags[:number % len(tags) + 1],
+                ingredients[number % 10:number % 10 + 5],
+                name=f'Рецепт {number}',
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in authors[1:3]:
+            Follow.objects.create(user=cls.user, author=author)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def get_list(self, client, limit, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response.data['results']
+
+    def test_anonymous(self):
+        client = APIClient()
+        for limit in (6, 50):
+            # COUNT, рецепты страницы с авторами, теги, ингредиенты.
+            self.get_list(client, limit, 4)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        # Первый запрос загружает токен и множества избранного,
+        # корзины и подписок пользователя, следующие - только
+        # пользователя по id из кэша токенов.
+        self.get_list(client, 6, 8)
+        for limit in (6, 50):
+            results = self.get_list(client, limit, 5)
+        favorites = set(Favorite.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', flat=True))
+        carts = set(ShoppingCart.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', flat=True))
+        following = set(Follow.objects.filter(
+            user=self.user
+        ).values_list('author_id', flat=True))
+        for recipe in results:
+            self.assertEqual(recipe['is_favorited'], recipe['id'] in favorites)
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in carts
+            )
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] in following,
+            )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListCacheTest(CacheTestCase):
+    """
+    Кэш списка рецептов: ключ строится только из параметров списка,
+    а сброс меняет версию и не трогает чужие ключи общего кэша.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        tags, ingredients = create_catalog()
+        cls.recipe = create_recipe(create_user(0), tags, ingredients[:3])
+
+    def get(self, query, queries):
+        with self.assertNumQueries(queries):
+            response = APIClient().get(f'/api/recipes/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_unknown_params(self):
+        # Запросы с посторонними параметрами не сохраняются в кэш.
+        self.get('?limit=3&x=1', 4)
+        self.get('?limit=3', 4)
+        # И читают страницу, сохраненную без них.
+        response = self.get('?x=2&limit=3', 0)
+        self.assertNotIn('x=', str(response.data))
+        self.get('?limit=3&tags=tag0', 5)
+        self.get('?tags=tag0&limit=3&y=1', 0)
+
+    # Сразу выполняются только сбросы кэша: фоновые пересчеты
+    # не должны обращаться к базе теста из других потоков.
+    @mock.patch('api.cache.transaction', mock.Mock(
+        on_commit=lambda callback: callback()
+    ))
+    def test_clear(self):
+        other = caches['recipes']
+        other.set('unrelated', 1)
+        self.get('', 4)
+        self.get('', 0)
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assertEqual(self.get('', 4).data['results'][0]['name'],
+                         'Новое название')
+        self.assertEqual(other.get('unrelated'), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingListTest(CacheTestCase):
+    """
+    Сводные списки покупок совпадают с пересчитанными заново после
+    любых изменений корзин и рецептов: через API, через ORM, как в
+    админке, и при каскадном удалении.
+    """
+    def setUp(self):
+        super().setUp()
+        self.tags, self.ingredients = create_catalog(ingredients=7)
+        self.author = create_user(0)
+        self.buyers = [create_user(number) for number in range(1, 3)]
+        self.recipe = create_recipe(
+            self.author, self.tags[:1], self.ingredients[:3]
+        )
+        self.other = create_recipe(
+            self.author, self.tags[:1], self.ingredients[2:5], name='Другой'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyers[0])
+
+    def assertVerified(self):
+        self.assertEqual(ShoppingListItem.objects.verify(), (set(), set()))
+
+    def test_api(self):
+        for recipe in (self.recipe, self.other):
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertVerified()
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=self.buyers[0], ingredient=self.ingredients[2]
+        ).amount, 20)
+        author = APIClient()
+        author.force_authenticate(self.author)
+        # Один ингредиент не меняется, один меняет количество,
+        # один удаляется и один добавляется.
+        response = author.patch(f'/api/recipes/{self.recipe.id}/', {
+            'tags': [self.tags[0].id],
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 10},
+                {'id': self.ingredients[1].id, 'amount': 25},
+                {'id': self.ingredients[5].id, 'amount': 5},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertVerified()
+        response = self.client.delete(
+            f'/api/recipes/{self.other.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertVerified()
+        response = author.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertVerified()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_orm(self):
+        for buyer in self.buyers:
+            ShoppingCart.objects.create(user=buyer, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.buyers[0], recipe=self.other)
+        self.assertVerified()
+        amount = IngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[5], amount=7
+        )
+        self.assertVerified()
+        amount.amount = 3
+        amount.save()
+        self.assertVerified()
+        amount.ingredient = self.ingredients[6]
+        amount.save()
+        self.assertVerified()
+        amount.recipe = self.other
+        amount.save()
+        self.assertVerified()
+        amount.delete()
+        self.assertVerified()
+        ShoppingCart.objects.filter(user=self.buyers[1]).delete()
+        self.assertVerified()
+        self.other.delete()
+        self.assertVerified()
+        self.buyers[0].delete()
+        self.assertVerified()
+        ShoppingCart.objects.create(user=self.buyers[1], recipe=self.recipe)
+        self.author.delete()
+        self.assertVerified()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def download(self, export_format):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': export_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{export_format}"',
+        )
+        content = b''.join(response.streaming_content).decode()
+        return response['Content-Type'], content
+
+    def test_download(self):
+        for recipe in (self.recipe, self.other):
+            ShoppingCart.objects.create(user=self.buyers[0], recipe=recipe)
+        expected = [
+            (f'Ингредиент {number}', amount, 'г')
+            for number, amount in ((0, 10), (1, 10), (2, 20), (3, 10), (4, 10))
+        ]
+        content_type, content = self.download('txt')
+        self.assertEqual(content_type, 'text/plain; charset=utf-8')
+        self.assertEqual(content.splitlines(), ['Список ингредиентов', ''] + [
+            f'<{number}> {name} - {amount}, {unit}'
+            for number, (name, amount, unit) in enumerate(expected, 1)
+        ])
+        content_type, content = self.download('csv')
+        self.assertEqual(content_type, 'text/csv; charset=utf-8')
+        self.assertEqual(list(csv.reader(content.splitlines())), [
+            ['Ингредиент', 'Количество', 'Единица измерения'],
+            *([name, str(amount), unit] for name, amount, unit in expected),
+        ])
+        content_type, content = self.download('json')
+        self.assertEqual(content_type, 'application/json')
+        self.assertEqual(json.loads(content), [
+            {'name': name, 'amount': amount, 'measurement_unit': unit}
+            for name, amount, unit in expected
+        ])
+
+    def test_download_empty(self):
+        self.assertEqual(self.download('json')[1], '[]')
+
+    def test_download_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xml'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('format', response.data)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingListJobTest(CacheTestCase):
+    """
+    Повторный запрос PDF, в том числе параллельный, возвращает уже
+    поставленную задачу, а не ставит вторую.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        first = client.post('/api/shopping_list_jobs/')
+        second = client.post('/api/shopping_list_jobs/')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.data['id'], second.data['id'])
+
+    def test_concurrent(self):
+        job = jobs.enqueue_job(self.user)
+        # Параллельный запрос не увидел задачу при проверке,
+        # и ее вставка упирается в ограничение.
+        lookups = iter((lambda user: None, jobs.get_active_job))
+        with mock.patch('api.jobs.get_active_job',
+                        side_effect=lambda user: next(lookups)(user)):
+            self.assertEqual(jobs.enqueue_job(self.user), job)
+        self.assertEqual(ShoppingListJob.objects.count(), 1)
+        job.status = ShoppingListJob.DONE
+        job.save()
+        self.assertNotEqual(jobs.enqueue_job(self.user), job)
+
+
+class AuthorChangeTest(TestCase):
+    """
+    Кэш списка рецептов сбрасывается только при изменении данных
+    автора, которые в нем выводятся.
+    """
+    def assertCleared(self, user, cleared, **kwargs):
+        with mock.patch('api.signals.clear_recipes_cache') as clear:
+            user.save(**kwargs)
+        self.assertEqual(clear.called, cleared)
+
+    def test_changes(self):
+        with mock.patch('api.signals.clear_recipes_cache') as clear:
+            user = create_user(0)
+        self.assertFalse(clear.called)
+        user = CustomUser.objects.get(pk=user.pk)
+        self.assertCleared(user, False)
+        user.set_password('new-password')
+        self.assertCleared(user, False)
+        user.first_name = 'Другое имя'
+        user.last_login = timezone.now()
+        self.assertCleared(user, False, update_fields=['last_login'])
+        self.assertCleared(user, True)
+        self.assertCleared(user, False)
+        user.username = 'renamed'
+        self.assertCleared(user, True, update_fields=['username'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch('django.db.transaction.on_commit', lambda callback: callback())
+class CatalogVersionTest(CacheTestCase):
+    """
+    Справочники в памяти процесса перечитываются после любого
+    изменения тегов и ингредиентов, в том числе из loaddata.
+    """
+    def get_names(self, url):
+        return {item['name'] for item in APIClient().get(url).data}
+
+    def test_tags(self):
+        tag = Tag.objects.create(name='Завтрак', color='#000001',
+                                 slug='breakfast')
+        self.assertEqual(self.get_names('/api/tags/'), {'Завтрак'})
+        tag.name = 'Обед'
+        tag.save_base(raw=True)
+        self.assertEqual(self.get_names('/api/tags/'), {'Обед'})
+        tag.delete()
+        self.assertEqual(self.get_names('/api/tags/'), set())
+
+    def test_ingredients(self):
+        ingredient = Ingredient(name='Соль', measurement_unit='г')
+        ingredient.save_base(raw=True)
+        self.assertEqual(self.get_names('/api/ingredients/'), {'Соль'})
+        Ingredient.objects.filter(pk=ingredient.pk).delete()
+        self.assertEqual(self.get_names('/api/ingredients/'), set())
+
+
+def create_image():
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeWriteQueriesTest(CacheTestCase):
+    """
+    Создание и изменение рецепта выполняют одно и то же число
+    запросов при любом количестве тегов и ингредиентов, а изменение
+    трогает только отличающиеся строки состава.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.settings = override_settings(MEDIA_ROOT=cls.media)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags, cls.ingredients = create_catalog(tags=6, ingredients=40)
+        cls.author = create_user(0)
+        cls.buyer = create_user(1)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def get_data(self, tags, amounts):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': create_image(),
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ],
+        }
+
+    def count_queries(self, method, url, data, status):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.data)
+        return len(queries), response.data['id']
+
+    def create(self, tags, amounts):
+        return self.count_queries(
+            'post', '/api/recipes/', self.get_data(tags, amounts), 201
+        )
+
+    def update(self, recipe_id, tags, amounts):
+        return self.count_queries(
+            'patch', f'/api/recipes/{recipe_id}/',
+            self.get_data(tags, amounts), 200,
+        )
+
+    def assertAmounts(self, recipe_id, amounts):
+        self.assertEqual(
+            dict(IngredientAmount.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')),
+            {ingredient.id: amount for ingredient, amount in amounts.items()},
+        )
+
+    def test_create(self):
+        # Первый запрос загружает справочники и кэши пользователя.
+        self.create(self.tags[:1], {self.ingredients[0]: 10})
+        counts = []
+        for size in (1, 5, 30):
+            amounts = dict.fromkeys(self.ingredients[:size], 10)
+            queries, recipe_id = self.create(self.tags[:size % 6 + 1], amounts)
+            self.assertAmounts(recipe_id, amounts)
+            counts.append(queries)
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_update(self):
+        counts = []
+        for size in (4, 20):
+            ingredients = self.ingredients[:size]
+            _, recipe_id = self.create(
+                self.tags[:1], dict.fromkeys(ingredients, 10)
+            )
+            ShoppingCart.objects.create(user=self.buyer, recipe_id=recipe_id)
+            # Первая четверть не меняется, последняя удаляется,
+            # у остальных меняется количество, и четверть добавляется.
+            part = size // 4
+            new_amounts = {
+                **dict.fromkeys(ingredients[:part], 10),
+                **dict.fromkeys(ingredients[part:size - part], 15),
+                **dict.fromkeys(self.ingredients[size:size + part], 5),
+            }
+            queries, _ = self.update(
+                recipe_id, self.tags[1:part + 1], new_amounts
+            )
+            self.assertAmounts(recipe_id, new_amounts)
+            self.assertEqual(
+                ShoppingListItem.objects.verify(), (set(), set())
+            )
+            counts.append(queries)
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_update_unchanged(self):
+        amounts = dict.fromkeys(self.ingredients[:5], 10)
+        _, recipe_id = self.create(self.tags[:2], amounts)
+        with CaptureQueriesContext(connection) as queries:
+            self.update(recipe_id, self.tags[:2], amounts)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'recipes_ingredientamount' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ])
+        self.assertAmounts(recipe_id, amounts)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeSearchTest(CacheTestCase):
+    """
+    Полнотекстовый поиск рецептов: формы слов, буква «ё» и порядок
+    по релевантности, совпадение в названии важнее описания.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(0)
+        recipes = (
+            ('Пирог с капустой', 'Тесто и начинка.'),
+            ('Салат', 'Подается к пирогам с капустой.'),
+            ('Ёжики в томате', 'Тефтели из фарша.'),
+            ('Суп', 'Овощной.'),
+        )
+        cls.ids = {}
+        for name, text in recipes:
+            recipe = Recipe.objects.create(
+                author=author, name=name, text=text, cooking_time=10,
+                image='recipes/test.png',
+            )
+            cls.ids[name] = recipe.id
+
+    def search(self, query):
+        response = APIClient().get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_search(self):
+        self.assertEqual(
+            self.search('пироги капуста'), ['Пирог с капустой', 'Салат']
+        )
+        self.assertEqual(self.search('ежики'), ['Ёжики в томате'])
+        self.assertEqual(self.search('тефтели'), ['Ёжики в томате'])
+        self.assertEqual(self.search('борщ'), [])
+
+    def test_update(self):
+        Recipe.objects.filter(pk=self.ids['Суп']).first().delete()
+        recipe = Recipe.objects.get(pk=self.ids['Салат'])
+        recipe.text = 'Овощной.'
+        recipe.save()
+        self.assertEqual(self.search('капуста'), ['Пирог с капустой'])
+        self.assertEqual(self.search('овощной'), ['Салат'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Только для PostgreSQL')
+    def test_postgresql_index(self):
+        self.assertFalse(Recipe.objects.filter(
+            search_vector__isnull=True
+        ).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexdef FROM pg_indexes '
+                "WHERE indexname = 'recipe_search_vector_idx'"
+            )
+            self.assertIn('USING gin (search_vector)', cursor.fetchone()[0])
+            # На четырех строках планировщик выбрал бы полный просмотр.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search_recipes(Recipe.objects.all(), 'пироги').explain()
+        self.assertIn('recipe_search_vector_idx', plan)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TagsFilterTest(CacheTestCase):
+    """
+    Фильтр по тегам: по умолчанию рецепты хотя бы с одним из тегов,
+    с tags_mode=all - только со всеми.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags, _ = create_catalog(ingredients=0)
+        author = create_user(0)
+        for number, tags in enumerate(
+            (cls.tags[:1], cls.tags[:2], cls.tags, cls.tags[2:])
+        ):
+            create_recipe(author, tags, [], name=f'Рецепт {number}')
+
+    def get_names(self, query, queries=4):
+        with self.assertNumQueries(queries):
+            response = APIClient().get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.data['results']}
+
+    def test_any(self):
+        self.assertEqual(
+            self.get_names('tags=tag0&tags=tag1', queries=5),
+            {'Рецепт 0', 'Рецепт 1', 'Рецепт 2'},
+        )
+        self.assertEqual(
+            self.get_names('tags=tag0&tags=tag2&tags_mode=any'),
+            {'Рецепт 0', 'Рецепт 1', 'Рецепт 2', 'Рецепт 3'},
+        )
+
+    def test_all(self):
+        self.assertEqual(
+            self.get_names('tags=tag0&tags=tag1&tags_mode=all', queries=5),
+            {'Рецепт 1', 'Рецепт 2'},
+        )
+        self.assertEqual(
+            self.get_names('tags=tag0&tags=tag1&tags=tag2&tags_mode=all'),
+            {'Рецепт 2'},
+        )
+        self.assertEqual(
+            self.get_names('tags=tag1&tags_mode=all'),
+            {'Рецепт 1', 'Рецепт 2'},
+        )
+
+    def test_invalid_mode(self):
+        response = APIClient().get('/api/recipes/?tags=tag0&tags_mode=some')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch('django.db.transaction.on_commit', lambda callback: callback())
+class TokenCacheTest(CacheTestCase):
+    """
+    Кэш токенов сбрасывается при удалении токена или пользователя,
+    а пользователь читается из базы на каждый запрос: изменения прав
+    видны сразу, и сохранение request.user не затирает чужие изменения.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(0)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def assertInvalidated(self, action, invalidated):
+        version = get_version()
+        action()
+        self.assertEqual(get_version() != version, invalidated)
+
+    def test_invalidation(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.first_name = 'Другое имя'
+        user.set_password('new-password')
+        user.is_active = False
+        self.assertInvalidated(user.save, False)
+        self.assertInvalidated(Token.objects.get(user=user).delete, True)
+        Token.objects.create(user=user)
+        self.assertInvalidated(user.delete, True)
+
+    def test_fresh_user(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.client.get('/api/users/me/').status_code, 200
+            )
+        follower = APIClient()
+        follower.force_authenticate(create_user(1))
+        response = follower.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'test-password',
+            'new_password': 'new-test-password',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 1)
+        self.assertTrue(self.user.check_password('new-test-password'))
+
+    def test_permissions(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FeedTest(CacheTestCase):
+    """
+    Лента подписок: новые рецепты раскладываются подписчикам,
+    при подписке копируются последние FEED_BACKFILL_LIMIT рецептов
+    автора, при отписке они удаляются, а страницы ленты по ключу
+    не теряют и не повторяют записи.
+    """
+    def setUp(self):
+        super().setUp()
+        self.tags, self.ingredients = create_catalog()
+        self.reader = create_user(0)
+        self.authors = [create_user(number) for number in range(1, 4)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def create_recipes(self, author, count):
+        return [
+            create_recipe(author, self.tags[:1], self.ingredients[:2],
+                          name=f'Рецепт {number}')
+            for number in range(count)
+        ]
+
+    def get_feed(self):
+        return list(FeedItem.objects.filter(
+            user=self.reader
+        ).values_list('recipe_id', flat=True))
+
+    def subscribe(self, author):
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_fan_out(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        followed = self.create_recipes(self.authors[0], 2)
+        self.create_recipes(self.authors[1], 2)
+        self.assertEqual(
+            self.get_feed(), [recipe.id for recipe in reversed(followed)]
+        )
+        followed[0].delete()
+        self.assertEqual(self.get_feed(), [followed[1].id])
+
+    def test_backfill(self):
+        recipes = self.create_recipes(self.authors[0], 3)
+        with mock.patch('recipes.models.FEED_BACKFILL_LIMIT', 2):
+            self.subscribe(self.authors[0])
+        self.assertEqual(
+            self.get_feed(), [recipe.id for recipe in recipes[:0:-1]]
+        )
+
+    def test_unfollow(self):
+        first = self.create_recipes(self.authors[0], 2)
+        second = self.create_recipes(self.authors[1], 2)
+        for author in self.authors[:2]:
+            self.subscribe(author)
+        self.assertEqual(set(self.get_feed()),
+                         {recipe.id for recipe in first + second})
+        response = self.client.delete(
+            f'/api/users/{self.authors[0].id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(set(self.get_feed()),
+                         {recipe.id for recipe in second})
+
+    def test_pagination(self):
+        for author in self.authors:
+            self.create_recipes(author, 3)
+        # Одинаковая дата у части рецептов: порядок решает id.
+        Recipe.objects.filter(author=self.authors[1]).update(
+            pub_date=timezone.now()
+        )
+        for author in self.authors:
+            self.subscribe(author)
+        expected = self.get_feed()
+        self.assertEqual(len(expected), 9)
+        pages = []
+        url = '/api/recipes/feed/?limit=4'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data['next']
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertEqual(sum(pages, []), expected)
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in previous.data['results']], pages[1]
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MetricsTest(CacheTestCase):
+    """
+    Запросы потоковых ответов попадают в метрики представления,
+    а метки не зависят от произвольных значений из запроса.
+    """
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(registry, 'series', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_queries(self, method):
+        queries = [name for name, _, _ in HISTOGRAMS].index('db_queries')
+        return {
+            view: series[queries].sum
+            for (view, label), series in registry.series.items()
+            if label == method
+        }
+
+    def test_streaming(self):
+        tags, ingredients = create_catalog()
+        user = create_user(0)
+        ShoppingCart.objects.create(
+            user=user, recipe=create_recipe(user, tags, ingredients[:3])
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(
+                '/api/recipes/download_shopping_cart/?format=txt'
+            )
+            content = b''.join(response.streaming_content)
+        self.assertEqual(content.decode().count('<'), 3)
+        self.assertEqual(
+            list(self.get_queries('GET').values()), [len(context)]
+        )
+
+    def test_labels(self):
+        APIClient().generic('PURGE', '/api/tags/')
+        self.assertEqual(list(self.get_queries('other')), ['tags-list'])
+        self.assertEqual(
+            format_labels(('a"b\\c\nd', 'GET')),
+            'view="a\\"b\\\\c\\nd",method="GET"'
+        )
@@ -1,13 +1,18 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from api.views import (IngredientViewSet, RecipeViewSet,
+                       ShoppingListJobViewSet, TagViewSet, metrics)
 
 router_v1 = DefaultRouter()
 router_v1.register('tags', TagViewSet, basename='tags')
 router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
+router_v1.register(
+    'shopping_list_jobs', ShoppingListJobViewSet, basename='shopping-list-jobs'
+)
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
     path('', include(router_v1.urls))
 ]
@@ -1,43 +1,62 @@
-from django.http import HttpResponse
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.http import FileResponse
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen.canvas import Canvas
 
-from recipes.models import IngredientAmount
+from foodgram.settings import BASE_DIR
+from .exports import TITLE, format_item, get_shopping_list
 
+FONT_NAME = 'Verdana'
+FONT_PATH = os.path.join(BASE_DIR, 'Verdana.ttf')
+# Координаты и отступы на странице формата A4 (в пунктах).
+PAGE_TOP = 800
+LIST_TOP = 750
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 25
+# Документ держится в памяти, пока не превысит этот размер (в байтах),
+# затем сбрасывается во временный файл на диске.
+SPOOL_MAX_SIZE = 1024 * 1024
 
-def generate_shopping_list(request):
-    ingredients = IngredientAmount.objects.filter(
-        recipe__carts__user=request.user.id).values_list(
-        'ingredient__name', 'ingredient__measurement_unit', 'amount'
-    )
-    ingredients_dict = {}
-    for item in ingredients:
-        name = item[0]
-        if name not in ingredients_dict:
-            ingredients_dict[name] = {
-                'measurement_unit': item[1],
-                'amount': item[2]
-            }
-        else:
-            ingredients_dict[name]['amount'] += item[2]
-    pdfmetrics.registerFont(
-        TTFont('Verdana', 'Verdana.ttf', 'UTF-8')
-    )
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = (
-        'attachment; filename="shopping_list.pdf"'
-    )
-    page = Canvas(response)
-    page.setFont('Verdana', size=24)
-    page.drawString(200, 800, 'Список ингредиентов')
-    page.setFont('Verdana', size=16)
-    height = 750
-    for i, (name, data) in enumerate(ingredients_dict.items(), 1):
-        page.drawString(75, height, (
-            f'<{i}> {name} - {data["amount"]}, {data["measurement_unit"]}'
-        ))
-        height -= 25
+
+def register_fonts():
+    """
+    Регистрирует шрифт с поддержкой кириллицы.
+    Вызывается один раз при запуске приложения.
+    """
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH, 'UTF-8'))
+
+
+def render_shopping_list(user, file):
+    """
+    Записывает PDF со списком покупок пользователя в файловый объект.
+    """
+    page = Canvas(file)
+    page.setFont(FONT_NAME, size=24)
+    page.drawString(200, PAGE_TOP, TITLE)
+    page.setFont(FONT_NAME, size=16)
+    height = LIST_TOP
+    ingredients = get_shopping_list(user).iterator()
+    for i, item in enumerate(ingredients, 1):
+        if height < PAGE_BOTTOM:
+            page.showPage()
+            page.setFont(FONT_NAME, size=16)
+            height = PAGE_TOP
+        page.drawString(75, height, format_item(i, item))
+        height -= LINE_HEIGHT
     page.showPage()
     page.save()
-    return response
+
+
+def generate_shopping_list(request):
+    buffer = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    render_shopping_list(request.user, buffer)
+    buffer.seek(0)
+    return FileResponse(
+        buffer,
+        as_attachment=True,
+        filename='shopping_list.pdf',
+        content_type='application/pdf',
+    )
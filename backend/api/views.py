@@ -1,39 +1,126 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
-from rest_framework.decorators import action
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes)
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.cache import get_recipes_cache, get_recipes_list_key, is_cacheable
+from api.jobs import enqueue_job
+from api.metrics import registry
+from api.metrics import render as render_metrics
 from api.utils import generate_shopping_list
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.catalog import ingredients_catalog, tags_catalog
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, ShoppingListItem,
+                            ShoppingListJob, Tag)
+from recipes.pantry import pantry as recipes_pantry
+from .exports import (EXPORT_FORMATS, FileFormatNegotiation,
+                      stream_shopping_list)
 from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import LimitPageNumberPagination
-from .permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
+from .pagination import KeysetPagination, LimitPageNumberPagination
+from .permissions import (IsAdminOrMetricsToken, IsAdminOrReadOnly,
+                          IsOwnerOrReadOnly)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
-                          TagSerializer)
+                          ShoppingListJobSerializer, TagSerializer)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PANTRY_LIMIT = 10
+PANTRY_MAX_LIMIT = 100
+
+
+class CatalogMixin:
+    """
+    Отдает справочник из памяти процесса вместо запроса к базе.
+    Ответы содержат заголовки ETag и Last-Modified, поэтому
+    неизменившийся справочник возвращается ответом 304.
+    """
+    catalog = None
+
+    def get_catalog_rows(self, request, state):
+        return state.rows
+
+    def list(self, request, *args, **kwargs):
+        state = self.catalog.load()
+        rows = self.get_catalog_rows(request, state)
+        return self.get_catalog_response(
+            request,
+            state.version,
+            lambda: [self.catalog.as_dict(row) for row in rows],
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        state = self.catalog.load()
+        try:
+            row = state.by_id.get(int(kwargs['pk']))
+        except ValueError:
+            row = None
+        if row is None:
+            raise Http404
+        return self.get_catalog_response(
+            request, state.version, lambda: self.catalog.as_dict(row)
+        )
+
+    def get_catalog_response(self, request, version, get_data):
+        etag = quote_etag(f'{self.catalog.name}-{version}')
+        last_modified = int(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(get_data())
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class TagViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для операций с тегами.
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    catalog = tags_catalog
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для операций с ингредиентами.
     """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
-    filter_backend = (IngredientSearchFilter,)
+    catalog = ingredients_catalog
+    filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
 
+    def get_catalog_rows(self, request, state):
+        """
+        Автодополнение по названию: сначала ингредиенты, название
+        которых начинается с запроса, затем содержащие его.
+        """
+        query = request.query_params.get(IngredientSearchFilter.search_param)
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValidationError(
+                    {'limit': 'Лимит должен быть целым числом больше 0.'}
+                )
+            limit = int(limit)
+        if not query:
+            return state.rows[:limit]
+        return state.index.search(query, limit)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """
@@ -46,12 +133,61 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_class = RecipeFilter
     pagination_class = LimitPageNumberPagination
 
+    def get_queryset(self):
+        """
+        Возвращает рецепты вместе со всеми данными, нужными сериализатору:
+        автор, теги и ингредиенты подгружаются заранее, а признаки
+        избранного, списка покупок и подписки на автора сериализатор
+        берет из закэшированных множеств пользователя. Количество
+        запросов не зависит от размера страницы.
+        """
+        return Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'amounts',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            ),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страницы списка рецептов для анонимных пользователей отдаются
+        из кэша. Кэш сбрасывается сигналами при изменении рецептов.
+        """
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        cache = get_recipes_cache()
+        key = get_recipes_list_key(request)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if is_cacheable(request):
+                cache.set(key, response.data)
+            return response
+        return Response(data)
+
+    def perform_create(self, serializer):
+        recipe = serializer.save()
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
+
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
+
+    def perform_destroy(self, instance):
+        # Списки покупок уменьшают сигналы удаления ингредиентов
+        # и корзин рецепта, пакет сводит их в несколько запросов.
+        with ShoppingListItem.objects.batch():
+            instance.delete()
+
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
-        return self.post_or_delete(
-            request, ShoppingCart, ShoppingCartSerializer, pk=pk
-        )
+        # Список покупок меняют сигналы корзины в той же транзакции.
+        with transaction.atomic():
+            return self.post_or_delete(
+                request, ShoppingCart, ShoppingCartSerializer, pk=pk
+            )
 
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
@@ -74,7 +210,140 @@ class RecipeViewSet(viewsets.ModelViewSet):
         model_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk):
+        """
+        Похожие рецепты по составу ингредиентов из заранее
+        посчитанных списков, самые похожие первыми.
+        """
+        recipe = get_object_or_404(Recipe, pk=pk)
+        queryset = self.get_queryset().filter(
+            similar_to__recipe=recipe
+        ).order_by('-similar_to__score', '-similar_to__common_tags', '-id')
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['GET'],
             permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        Страница ленты читается по ключу из таблицы лент, затем
+        рецепты страницы загружаются по id.
+        """
+        paginator = KeysetPagination()
+        items = paginator.paginate_queryset(
+            FeedItem.objects.filter(user=request.user).only(
+                'id', 'recipe_id', 'pub_date'
+            ),
+            request,
+            view=self,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [item.recipe_id for item in items]
+        )
+        serializer = self.get_serializer(
+            [recipes[item.recipe_id] for item in items
+             if item.recipe_id in recipes],
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def get_pantry_params(request):
+        ingredient_ids = set()
+        for value in request.query_params.getlist('ingredients'):
+            for item in filter(None, map(str.strip, value.split(','))):
+                if not item.isdigit():
+                    raise ValidationError({'ingredients': (
+                        'Ингредиенты передаются списком id через запятую.'
+                    )})
+                ingredient_ids.add(int(item))
+        if not ingredient_ids:
+            raise ValidationError(
+                {'ingredients': 'Укажите хотя бы один ингредиент.'}
+            )
+        unknown = ingredient_ids - ingredients_catalog.load().by_id.keys()
+        if unknown:
+            raise ValidationError({'ingredients': (
+                f'Ингредиентов {sorted(unknown)} нет в справочнике.'
+            )})
+        limit = request.query_params.get('limit', str(PANTRY_LIMIT))
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValidationError(
+                {'limit': 'Лимит должен быть целым числом больше 0.'}
+            )
+        return ingredient_ids, min(int(limit), PANTRY_MAX_LIMIT)
+
+    @action(detail=False, methods=['GET'])
+    def pantry(self, request):
+        """
+        Что приготовить из имеющихся продуктов: рецепты с наибольшей
+        долей ингредиентов из списка ingredients. Рецепты подбираются
+        по индексу в памяти процесса, из базы загружается только
+        найденная страница.
+        """
+        ingredient_ids, limit = self.get_pantry_params(request)
+        found = recipes_pantry.search(ingredient_ids, limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _, _ in found]
+        )
+        data = []
+        for recipe_id, coverage, owned, total in found:
+            if recipe_id not in recipes:
+                continue
+            item = self.get_serializer(recipes[recipe_id]).data
+            item['coverage'] = round(coverage, 4)
+            item['missing_ingredients'] = total - owned
+            data.append(item)
+        return Response(data)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=FileFormatNegotiation)
     def download_shopping_cart(self, request):
-        return generate_shopping_list(request)
+        """
+        Список покупок файлом: PDF по умолчанию или txt, csv, json
+        в параметре format. Текстовые форматы отдаются потоком.
+        """
+        export_format = request.query_params.get('format', 'pdf')
+        if export_format == 'pdf':
+            return generate_shopping_list(request)
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'format': (
+                f'Доступные форматы: pdf, {", ".join(EXPORT_FORMATS)}.'
+            )})
+        return stream_shopping_list(request.user, export_format)
+
+
+class ShoppingListJobViewSet(mixins.CreateModelMixin,
+                             mixins.RetrieveModelMixin,
+                             viewsets.GenericViewSet):
+    """
+    Вьюсет для асинхронной подготовки PDF со списком покупок.
+    POST ставит задачу в очередь, GET по id возвращает ее статус
+    и, когда файл готов, ссылку на него в хранилище.
+    """
+    serializer_class = ShoppingListJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return ShoppingListJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        with transaction.atomic():
+            job = enqueue_job(request.user)
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes((IsAdminOrMetricsToken,))
+def metrics(request):
+    """
+    Гистограммы времени ответа, SQL-запросов и сериализации
+    по представлениям в текстовом формате Prometheus.
+    """
+    return HttpResponse(
+        render_metrics(registry.collect()), content_type=METRICS_CONTENT_TYPE
+    )
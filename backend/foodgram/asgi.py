@@ -0,0 +1,16 @@
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+# Django 2.2 не содержит ASGI-обработчика, поэтому WSGI-приложение
+# запускается под ASGI-сервером (uvicorn, daphne) через адаптер asgiref.
+# Адаптер выполняет запросы процесса в одном потоке по очереди,
+# параллельность дают только процессы сервера (--workers).
+application = WsgiToAsgi(get_wsgi_application())
+
+from recipes.pantry import pantry  # noqa: E402
+
+pantry.warm_up()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +77,72 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Ответы со списком рецептов для анонимных пользователей.
+    # Файловый кэш общий для всех воркеров gunicorn на сервере.
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPES_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'RECIPES_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_recipes')
+        ),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # Версии справочников тегов и ингредиентов, индекса подбора рецептов
+    # по продуктам и кэша токенов.
+    'catalog': {
+        'BACKEND': os.getenv(
+            'CATALOG_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CATALOG_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_catalog')
+        ),
+        'TIMEOUT': None,
+    },
+    # Избранное, корзина и подписки каждого пользователя для признаков
+    # is_favorited, is_in_shopping_cart и is_subscribed в ответах.
+    'memberships': {
+        'BACKEND': os.getenv(
+            'MEMBERSHIPS_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'MEMBERSHIPS_CACHE_LOCATION',
+            default=os.path.join(
+                tempfile.gettempdir(), 'foodgram_memberships'
+            )
+        ),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # Снимки метрик запросов от всех воркеров для /api/metrics/.
+    'metrics': {
+        'BACKEND': os.getenv(
+            'METRICS_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'METRICS_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_metrics')
+        ),
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -95,7 +163,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -136,3 +204,33 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 EMPTY_FIELD = '-пусто-'
+
+# Уменьшенные копии картинок рецептов готовятся в фоновых потоках.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+# PDF со списками покупок, заказанные через очередь задач.
+SHOPPING_LIST_WORKERS = int(os.getenv('SHOPPING_LIST_WORKERS', default=2))
+
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', default=100))
+
+# Сколько похожих рецептов хранится для каждого рецепта.
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', default=10))
+
+# Как часто (в секундах) воркер перестраивает индекс подбора рецептов
+# по ингредиентам, если рецепты менялись в других процессах.
+PANTRY_REBUILD_INTERVAL = int(
+    os.getenv('PANTRY_REBUILD_INTERVAL', default=60)
+)
+
+# Кэш токенов в памяти воркера: сколько токенов хранить и сколько
+# секунд доверять записи без обращения к базе.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=10000))
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60)
+)
+
+# Метрики запросов: как часто воркер сохраняет свои гистограммы
+# и токен, с которым Prometheus может забирать /api/metrics/.
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', default=10))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
@@ -5,3 +5,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Индекс подбора рецептов по ингредиентам строится при запуске воркера.
+from recipes.pantry import pantry  # noqa: E402
+
+pantry.warm_up()
@@ -1,59 +1,121 @@
 from django.contrib import admin
 
 from foodgram.settings import EMPTY_FIELD
-from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                     ShoppingCart, Tag)
+from .counters import count_related
+from .models import (Favorite, FeedItem, Ingredient, IngredientAmount,
+                     Recipe, ShoppingCart, ShoppingListItem, ShoppingListJob,
+                     SimilarRecipe, Tag)
+from .paginators import EstimatedCountPaginator
+
+
+class LargeTableAdminMixin:
+    """
+    Настройки списка для больших таблиц: примерное количество строк
+    вместо COUNT(*) и без второго подсчета всей таблицы при поиске.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name', 'color', 'slug',)
+    list_display = ('name', 'color', 'slug', 'recipes_count',)
     search_fields = ('name',)
-    list_filter = ('name',)
     empty_value_display = EMPTY_FIELD
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=count_related(Recipe.tags.through, 'tag')
+        )
+
+    def recipes_count(self, obj):
+        return obj.recipes_count
+    recipes_count.short_description = 'Рецептов'
+
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit',)
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'measurement_unit', 'recipes_count',)
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     empty_value_display = EMPTY_FIELD
 
+    def get_queryset(self, request):
+        # Подзапрос выполняется только для строк текущей страницы.
+        return super().get_queryset(request).annotate(
+            recipes_count=count_related(IngredientAmount, 'ingredient')
+        )
+
+    def recipes_count(self, obj):
+        return obj.recipes_count
+    recipes_count.short_description = 'Рецептов'
+
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_counter',)
-    list_filter = ('author', 'name', 'tags',)
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'name', 'author', 'pub_date', 'favorites_count', 'carts_count',
+    )
+    list_select_related = ('author',)
+    list_filter = ('tags',)
+    search_fields = ('name', 'author__username', 'author__email',)
+    autocomplete_fields = ('author',)
     empty_value_display = EMPTY_FIELD
 
-    def favorites_counter(self, obj):
-        """
-        Метод для посчета количества добавлений
-        рецептов в список избранного пользователей.
-        """
-        return obj.favorites.count()
-
 
 @admin.register(IngredientAmount)
-class IngredientAmountAdmin(admin.ModelAdmin):
+class IngredientAmountAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
-    search_fields = ('recipe', 'ingredient',)
-    list_filter = ('recipe', 'ingredient',)
+    list_select_related = ('recipe', 'ingredient',)
+    search_fields = ('recipe__name', 'ingredient__name',)
+    autocomplete_fields = ('recipe', 'ingredient',)
     empty_value_display = EMPTY_FIELD
 
 
-@admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe',)
-    search_fields = ('user', 'recipe',)
-    list_filter = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe',)
+    search_fields = ('user__username', 'user__email', 'recipe__name',)
+    autocomplete_fields = ('user', 'recipe',)
     empty_value_display = EMPTY_FIELD
 
 
-@admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe',)
-    search_fields = ('user', 'recipe',)
-    list_filter = ('user', 'recipe',)
+admin.site.register(ShoppingCart, UserRecipeAdmin)
+admin.site.register(Favorite, UserRecipeAdmin)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount',)
+    list_select_related = ('user', 'ingredient',)
+    search_fields = ('user__username', 'ingredient__name',)
+    autocomplete_fields = ('user', 'ingredient',)
+    empty_value_display = EMPTY_FIELD
+
+
+@admin.register(FeedItem)
+class FeedItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'recipe', 'author', 'pub_date',)
+    list_select_related = ('user', 'recipe', 'author',)
+    search_fields = ('user__username', 'author__username',)
+    autocomplete_fields = ('user', 'recipe', 'author',)
+    empty_value_display = EMPTY_FIELD
+
+
+@admin.register(SimilarRecipe)
+class SimilarRecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('recipe', 'similar', 'score', 'common_tags',)
+    list_select_related = ('recipe', 'similar',)
+    search_fields = ('recipe__name',)
+    autocomplete_fields = ('recipe', 'similar',)
+    empty_value_display = EMPTY_FIELD
+
+
+@admin.register(ShoppingListJob)
+class ShoppingListJobAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'status', 'created', 'finished',)
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    list_filter = ('status',)
+    autocomplete_fields = ('user',)
     empty_value_display = EMPTY_FIELD
@@ -0,0 +1,151 @@
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from threading import Lock
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Ingredient, Tag
+
+CATALOG_CACHE = 'catalog'
+# Разделитель названий в общей строке поиска, в названиях не встречается.
+SEPARATOR = '\n'
+# Символ больше любого другого: все строки, начинающиеся с query,
+# лежат в отсортированном списке между query и query + LAST_CHAR.
+LAST_CHAR = chr(0x10FFFF)
+
+CatalogState = namedtuple(
+    'CatalogState', ('version', 'rows', 'by_id', 'index')
+)
+
+
+def normalize(value):
+    """
+    Приводит название к виду для поиска без учета регистра и буквы «ё».
+    """
+    return value.strip().casefold().replace('ё', 'е')
+
+
+class Catalog:
+    """
+    Копия справочника в памяти процесса в виде кортежей.
+    Справочник загружается из базы один раз и перечитывается,
+    только когда меняется его версия в общем кэше. Версией служит
+    время последнего изменения справочника.
+    """
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.state = CatalogState(None, (), {}, None)
+        self.lock = Lock()
+
+    @property
+    def version_key(self):
+        return f'catalog-version:{self.name}'
+
+    def get_version(self):
+        cache = caches[CATALOG_CACHE]
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time())
+            version = cache.get(self.version_key)
+        return version
+
+    def build_index(self, rows):
+        return None
+
+    def load(self):
+        """
+        Возвращает актуальное состояние справочника. Состояние
+        заменяется целиком, поэтому параллельные запросы никогда
+        не видят наполовину перестроенные данные.
+        """
+        version = self.get_version()
+        state = self.state
+        if version != state.version:
+            with self.lock:
+                state = self.state
+                if version != state.version:
+                    rows = tuple(
+                        self.model.objects.values_list(*self.fields)
+                    )
+                    state = self.state = CatalogState(
+                        version,
+                        rows,
+                        {row[0]: row for row in rows},
+                        self.build_index(rows),
+                    )
+        return state
+
+    def as_dict(self, row):
+        return dict(zip(self.fields, row))
+
+    def bump(self):
+        """
+        Отмечает справочник измененным после фиксации транзакции,
+        чтобы другие процессы не перечитали еще старые данные.
+        """
+        transaction.on_commit(lambda: caches[CATALOG_CACHE].set(
+            self.version_key, time.time()
+        ))
+
+
+class NameIndex:
+    """
+    Индекс для автодополнения по названию. Нормализованные названия
+    отсортированы: совпадения по началу названия находятся бинарным
+    поиском. Для поиска по подстроке названия склеены в одну строку,
+    по которой ищет встроенный str.find.
+    """
+    def __init__(self, rows, position):
+        pairs = sorted((normalize(row[position]), row) for row in rows)
+        self.keys = [key for key, _ in pairs]
+        self.rows = [row for _, row in pairs]
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + len(SEPARATOR)
+        self.text = SEPARATOR.join(self.keys)
+
+    def search(self, query, limit=None):
+        """
+        Возвращает строки, названия которых начинаются с query,
+        а затем строки, в названиях которых query встречается
+        в другом месте. Внутри каждой группы порядок алфавитный.
+        """
+        query = normalize(query)
+        if not query or SEPARATOR in query:
+            return self.rows[:limit]
+        start = bisect_left(self.keys, query)
+        stop = bisect_left(self.keys, query + LAST_CHAR, start)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        result = self.rows[start:stop]
+        position = self.text.find(query)
+        while position != -1 and (limit is None or len(result) < limit):
+            number = bisect_right(self.offsets, position) - 1
+            if self.offsets[number] != position:
+                result.append(self.rows[number])
+            # Следующее вхождение ищется уже в следующем названии.
+            position = self.text.find(
+                query,
+                self.offsets[number] + len(self.keys[number]) + len(SEPARATOR)
+            )
+        return result
+
+
+class IngredientCatalog(Catalog):
+    def build_index(self, rows):
+        return NameIndex(rows, self.fields.index('name'))
+
+    def search(self, query, limit=None):
+        return self.load().index.search(query, limit)
+
+
+tags_catalog = Catalog('tags', Tag, ('id', 'name', 'color', 'slug'))
+ingredients_catalog = IngredientCatalog(
+    'ingredients', Ingredient, ('id', 'name', 'measurement_unit')
+)
@@ -0,0 +1,45 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import CustomUser, Follow
+from .models import Favorite, Recipe, ShoppingCart
+
+# Хранимые счетчики: модель, поле счетчика, считаемая модель
+# и ее внешний ключ на модель со счетчиком.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counters(sender, instance, delta):
+    """
+    Изменяет счетчики, связанные с созданной или удаленной записью,
+    одним UPDATE с F(), без чтения текущего значения.
+    """
+    for model, field, related, key in COUNTERS:
+        if related is sender:
+            model.objects.filter(
+                pk=getattr(instance, f'{key}_id')
+            ).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_related(related, key):
+    return Coalesce(Subquery(
+        related.objects.filter(
+            **{key: OuterRef('pk')}
+        ).order_by().values(key).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount(model, field, related, key, check=False):
+    """
+    Сверяет счетчик с фактическим числом записей. Возвращает
+    количество расхождений; без check расхождения исправляются.
+    """
+    mismatched = model.objects.exclude(**{field: count_related(related, key)})
+    if check:
+        return mismatched.count()
+    return mismatched.update(**{field: count_related(related, key)})
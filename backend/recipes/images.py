@@ -0,0 +1,122 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from foodgram.settings import RECIPE_IMAGE_WORKERS
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Наибольшие ширина и высота уменьшенных копий, пропорции сохраняются.
+VARIANTS = {
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+VARIANT_FIELDS = tuple(f'image_{variant}' for variant in VARIANTS)
+IMAGE_FORMAT = 'WEBP'
+IMAGE_EXTENSION = 'webp'
+IMAGE_QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=RECIPE_IMAGE_WORKERS, thread_name_prefix='recipe-images'
+)
+
+
+def get_variant_name(recipe_id, source, variant):
+    # Копии лежат в папке рецепта: одинаковые имена картинок
+    # разных рецептов не перезаписывают копии друг друга.
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'recipes/{variant}/{recipe_id}/{stem}.{IMAGE_EXTENSION}'
+
+
+def has_actual_variants(recipe):
+    return all(
+        getattr(recipe, f'image_{variant}').name
+        == get_variant_name(recipe.pk, recipe.image.name, variant)
+        for variant in VARIANTS
+    )
+
+
+def delete_files(storage, names):
+    for name in names:
+        if name and storage.exists(name):
+            storage.delete(name)
+
+
+def resize(image, size):
+    copy = image.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    copy.save(buffer, IMAGE_FORMAT, quality=IMAGE_QUALITY, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(recipe_id):
+    """
+    Готовит уменьшенные копии картинки рецепта и сохраняет их
+    в хранилище рядом с оригиналом.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image or has_actual_variants(recipe):
+        return
+    source = recipe.image.name
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    storage = recipe.image.storage
+    old = {getattr(recipe, field).name for field in VARIANT_FIELDS} - {''}
+    for variant, size in VARIANTS.items():
+        name = get_variant_name(recipe_id, source, variant)
+        delete_files(storage, [name])
+        setattr(
+            recipe, f'image_{variant}', storage.save(name, resize(image, size))
+        )
+    new = {getattr(recipe, field).name for field in VARIANT_FIELDS}
+    # Картинку могли заменить, пока готовились копии: тогда копии
+    # устарели, а для новой картинки уже поставлена своя задача.
+    if not Recipe.objects.filter(pk=recipe_id, image=source).exists():
+        delete_files(storage, new - old)
+        return
+    recipe.save(update_fields=VARIANT_FIELDS)
+    # Копии прежней картинки удаляются, если на них не ссылаются
+    # другие рецепты: старые имена копий могли совпадать.
+    old -= new
+    if not old:
+        return
+    shared = set()
+    for field in VARIANT_FIELDS:
+        shared.update(
+            Recipe.objects.exclude(pk=recipe_id)
+            .filter(**{f'{field}__in': old})
+            .values_list(field, flat=True)
+        )
+    delete_files(storage, old - shared)
+
+
+def run_make_variants(recipe_id):
+    try:
+        make_variants(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить картинки рецепта %s', recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """
+    Ставит подготовку копий в очередь после фиксации транзакции,
+    чтобы фоновый поток увидел сохраненный рецепт.
+    """
+    recipe_id = recipe.pk
+    transaction.on_commit(
+        lambda: executor.submit(run_make_variants, recipe_id)
+    )
@@ -0,0 +1,7 @@
+def percentile(values, share):
+    """
+    Значение, меньше которого доля share замеров (без интерполяции).
+    Общая для команд нагрузочных замеров.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
@@ -0,0 +1,66 @@
+import random
+from statistics import mean, median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.catalog import ingredients_catalog
+from recipes.management.benchmarks import percentile
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время автодополнения ингредиентов на каждое нажатие '
+        'клавиши: пользователь набирает название по одной букве.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'words', nargs='*',
+            help='Набираемые слова. По умолчанию берутся из справочника.',
+        )
+        parser.add_argument(
+            '--samples', type=int, default=200,
+            help='Сколько случайных названий набрать из справочника.',
+        )
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--compare-db', action='store_true',
+            help='Замерить также запрос name__istartswith к базе.',
+        )
+
+    def handle(self, *args, **options):
+        words = options['words']
+        if not words:
+            names = [row[1] for row in ingredients_catalog.load().rows]
+            random.seed(0)
+            words = random.sample(names, min(options['samples'], len(names)))
+        keystrokes = [
+            word[:length] for word in words
+            for length in range(1, len(word) + 1)
+        ]
+        limit = options['limit']
+        ingredients_catalog.search('', limit)
+        self.report('память', keystrokes, lambda query: (
+            ingredients_catalog.search(query, limit)
+        ))
+        if options['compare_db']:
+            self.report('база', keystrokes, lambda query: list(
+                Ingredient.objects.filter(name__istartswith=query)[:limit]
+            ))
+
+    def report(self, title, keystrokes, search):
+        timings = []
+        for query in keystrokes:
+            started = perf_counter()
+            search(query)
+            timings.append((perf_counter() - started) * 1000000)
+        self.stdout.write(
+            f'{title}: нажатий {len(timings)}, '
+            f'среднее {mean(timings):.1f} мкс, '
+            f'p50 {median(timings):.1f} мкс, '
+            f'p95 {percentile(timings, 0.95):.1f} мкс, '
+            f'p99 {percentile(timings, 0.99):.1f} мкс, '
+            f'макс {max(timings):.1f} мкс'
+        )
@@ -0,0 +1,106 @@
+import random
+from statistics import mean, median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q
+
+from recipes.management.benchmarks import percentile
+from recipes.models import IngredientAmount
+from recipes.pantry import pantry
+
+
+def search_db(ingredient_ids, limit):
+    """
+    Тот же подбор одним запросом GROUP BY по составу всех рецептов.
+    """
+    return [
+        (row['recipe'], row['coverage'], row['owned'], row['total'])
+        for row in IngredientAmount.objects.values('recipe').annotate(
+            owned=Count('id', filter=Q(ingredient_id__in=ingredient_ids)),
+            total=Count('id'),
+        ).filter(owned__gt=0).annotate(coverage=ExpressionWrapper(
+            F('owned') * 1.0 / F('total'), output_field=FloatField()
+        )).order_by('-coverage', '-owned', '-recipe_id')[:limit]
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет подбор рецептов по имеющимся ингредиентам: '
+        'случайные наборы продуктов разного размера, популярные '
+        'ингредиенты попадают в набор чаще.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(5, 10, 20, 40),
+            help='Размеры наборов ингредиентов.',
+        )
+        parser.add_argument(
+            '--samples', type=int, default=50,
+            help='Сколько наборов каждого размера проверить.',
+        )
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--compare-db', action='store_true',
+            help='Замерить также запрос GROUP BY к базе и сверить ответы.',
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        index, _ = pantry.load()
+        self.stdout.write(
+            f'Индекс: рецептов {len(index.ids)}, '
+            f'битовых множеств {len(index.dense)}, '
+            f'массивов {len(index.sparse)}, '
+            f'построение {perf_counter() - started:.1f} с'
+        )
+        popularity = dict(IngredientAmount.objects.values_list(
+            'ingredient'
+        ).annotate(Count('id')).order_by())
+        ingredients = list(popularity)
+        weights = list(popularity.values())
+        random.seed(0)
+        limit = options['limit']
+        for size in options['sizes']:
+            pantries = []
+            for _ in range(options['samples']):
+                chosen = set()
+                while len(chosen) < min(size, len(ingredients)):
+                    chosen.update(random.choices(ingredients, weights))
+                pantries.append(chosen)
+            found = self.report(
+                f'{size} ингр., память', pantries,
+                lambda ids: pantry.search(ids, limit),
+            )
+            if options['compare_db']:
+                expected = self.report(
+                    f'{size} ингр., база', pantries,
+                    lambda ids: search_db(ids, limit),
+                )
+                self.compare(found, expected)
+
+    def report(self, title, pantries, search):
+        timings, results = [], []
+        for ingredient_ids in pantries:
+            started = perf_counter()
+            results.append(search(ingredient_ids))
+            timings.append((perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{title}: запросов {len(timings)}, '
+            f'среднее {mean(timings):.1f} мс, '
+            f'p50 {median(timings):.1f} мс, '
+            f'p95 {percentile(timings, 0.95):.1f} мс, '
+            f'p99 {percentile(timings, 0.99):.1f} мс, '
+            f'макс {max(timings):.1f} мс'
+        )
+        return results
+
+    def compare(self, found, expected):
+        mismatches = sum(
+            [row[0] for row in left] != [row[0] for row in right]
+            for left, right in zip(found, expected)
+        )
+        if mismatches:
+            self.stderr.write(f'Ответы различаются в {mismatches} наборах')
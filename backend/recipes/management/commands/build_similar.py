@@ -0,0 +1,29 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from foodgram.settings import SIMILAR_RECIPES_COUNT
+from recipes.similarity import rebuild_similar
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты для всех рецептов по составу '
+        'ингредиентов. После правки рецепта его соседи обновляются '
+        'автоматически, полный пересчет нужен после загрузки данных '
+        'и время от времени для уточнения остальных списков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count', type=int, default=SIMILAR_RECIPES_COUNT,
+            help='Сколько похожих рецептов хранить для каждого рецепта.',
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        total = rebuild_similar(options['count'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар похожих рецептов: {total} '
+            f'за {perf_counter() - started:.1f} с.'
+        ))
@@ -0,0 +1,273 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import MEMBERSHIPS_CACHE, bump_recipes_version
+from recipes.catalog import ingredients_catalog, tags_catalog
+from recipes.counters import COUNTERS, recount
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.pantry import pantry
+from recipes.search import rebuild_search_index
+from recipes.similarity import rebuild_similar
+from users.models import CustomUser, Follow
+
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Козлов')
+DISHES = ('Суп', 'Салат', 'Пирог', 'Каша', 'Запеканка', 'Рагу', 'Омлет')
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 500, 1000)
+# Доли рецептов с одним, двумя и тремя тегами.
+TAG_COUNT_WEIGHTS = (50, 35, 15)
+PASSWORD = 'benchmark-password'
+
+
+def zipf_weights(size):
+    """
+    Накопленные веса распределения Ципфа: первый элемент популярнее
+    второго вдвое, третьего втрое и так далее. Так распределены
+    и авторы рецептов, и ингредиенты, и избранное.
+    """
+    return list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def pick(items, cum_weights, count):
+    """
+    Выбирает count разных элементов с учетом весов.
+    """
+    count = min(count, len(items))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(random.choices(
+            items, cum_weights=cum_weights, k=count - len(chosen)
+        ))
+    return chosen
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'подписками, избранным и корзинами для нагрузочных замеров. '
+        'Ингредиенты и теги берутся из справочника (loaddata dump.json).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном пользователя.',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в корзине пользователя.',
+        )
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить пользователей с этим префиксом и их данные.',
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            self.step('Удаление старых данных', self.clear)
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        self.tags = list(Tag.objects.values_list('id', flat=True))
+        if not self.ingredients or not self.tags:
+            raise CommandError(
+                'Справочник пуст, сначала выполните loaddata dump.json.'
+            )
+        random.shuffle(self.ingredients)
+        self.ingredient_weights = zipf_weights(len(self.ingredients))
+        self.image = self.get_image()
+        users = self.step('Пользователи', self.create_users, options['users'])
+        recipes = self.step(
+            'Рецепты', self.create_recipes, users, options['recipes']
+        )
+        self.step('Подписки', self.create_follows, users, options['follows'])
+        for title, model, average in (
+            ('Избранное', Favorite, options['favorites']),
+            ('Корзины', ShoppingCart, options['carts']),
+        ):
+            self.step(title, self.create_choices, model, users, recipes,
+                      average)
+        self.step('Списки покупок', ShoppingListItem.objects.rebuild)
+        self.step('Ленты подписок', FeedItem.objects.rebuild)
+        self.step('Счетчики', self.recount)
+        self.step('Поисковый индекс', rebuild_search_index)
+        self.step('Похожие рецепты', rebuild_similar)
+        self.bump_caches()
+
+    def step(self, title, function, *args):
+        started = perf_counter()
+        result = function(*args)
+        self.stdout.write(f'{title}: {perf_counter() - started:.1f} с')
+        return result
+
+    @staticmethod
+    def recount():
+        # bulk_create не отправляет сигналы, счетчики пересчитываются.
+        for counter in COUNTERS:
+            recount(*counter)
+
+    @staticmethod
+    def bump_caches():
+        # Сигналы, которые сбрасывают кэши и копии данных в памяти
+        # процессов, при массовой вставке не отправлялись.
+        bump_recipes_version()
+        caches[MEMBERSHIPS_CACHE].clear()
+        tags_catalog.bump()
+        ingredients_catalog.bump()
+        pantry.bump()
+
+    def clear(self):
+        CustomUser.objects.filter(username__startswith=self.prefix).delete()
+
+    def get_image(self):
+        name = f'recipes/{self.prefix}.jpg'
+        if not default_storage.exists(name):
+            content = BytesIO()
+            Image.new('RGB', (600, 400), (230, 160, 60)).save(content, 'JPEG')
+            name = default_storage.save(name, ContentFile(content.getvalue()))
+        return name
+
+    def insert(self, model, objects, key=None):
+        """
+        Вставляет объекты пачками и возвращает их id. SQLite
+        не возвращает id после bulk_create, тогда они читаются
+        по уникальному полю key.
+        """
+        ids = []
+        for batch in batches(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=key is None)
+            if key is None:
+                continue
+            if batch[0].pk is None:
+                values = [getattr(obj, key) for obj in batch]
+                found = dict(model.objects.filter(
+                    **{f'{key}__in': values}
+                ).values_list(key, 'id'))
+                ids.extend(found[value] for value in values)
+            else:
+                ids.extend(obj.pk for obj in batch)
+        return ids
+
+    def create_users(self, count):
+        start = CustomUser.objects.filter(
+            username__startswith=self.prefix
+        ).count()
+        password = make_password(PASSWORD)
+        return self.insert(CustomUser, [
+            CustomUser(
+                username=f'{self.prefix}{number}',
+                email=f'{self.prefix}{number}@example.com',
+                first_name=random.choice(FIRST_NAMES),
+                last_name=random.choice(LAST_NAMES),
+                password=password,
+            )
+            for number in range(start, start + count)
+        ], key='username')
+
+    def create_recipes(self, users, count):
+        authors = zipf_weights(len(users))
+        start = Recipe.objects.filter(
+            author__username__startswith=self.prefix
+        ).count()
+        ids = []
+        for numbers in batches(range(start, start + count), self.batch_size):
+            recipes = [
+                Recipe(
+                    author_id=random.choices(users, cum_weights=authors)[0],
+                    name=f'{random.choice(DISHES)} {self.prefix} {number}',
+                    image=self.image,
+                    text='Синтетический рецепт для нагрузочных замеров.',
+                    cooking_time=min(600, max(
+                        1, int(random.lognormvariate(3.4, 0.6))
+                    )),
+                )
+                for number in numbers
+            ]
+            batch_ids = self.insert(Recipe, recipes, key='name')
+            self.create_composition(batch_ids)
+            ids.extend(batch_ids)
+        return ids
+
+    def create_composition(self, recipe_ids):
+        """
+        Теги и ингредиенты рецептов: чаще всего 1-2 тега
+        и 4-8 ингредиентов, популярные ингредиенты встречаются
+        в рецептах намного чаще редких.
+        """
+        tags, amounts = [], []
+        for recipe_id in recipe_ids:
+            count = random.choices((1, 2, 3), weights=TAG_COUNT_WEIGHTS)[0]
+            tags.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in random.sample(
+                    self.tags, min(count, len(self.tags))
+                )
+            )
+            amounts.extend(
+                IngredientAmount(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=random.choice(AMOUNTS),
+                )
+                for ingredient_id in pick(
+                    self.ingredients, self.ingredient_weights,
+                    int(random.triangular(2, 15, 5)),
+                )
+            )
+        self.insert(Recipe.tags.through, tags)
+        self.insert(IngredientAmount, amounts)
+
+    def create_follows(self, users, average):
+        weights = zipf_weights(len(users))
+        follows = [
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in pick(
+                users, weights, random.randint(0, 2 * average)
+            )
+            if author_id != user_id
+        ]
+        self.insert(Follow, follows)
+
+    def create_choices(self, model, users, recipes, average):
+        if not recipes:
+            return
+        popular = recipes[:]
+        random.shuffle(popular)
+        weights = zipf_weights(len(popular))
+        self.insert(model, [
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in users
+            for recipe_id in pick(
+                popular, weights, random.randint(0, 2 * average)
+            )
+        ])
@@ -0,0 +1,212 @@
+import csv
+import json
+import os
+from io import StringIO
+from itertools import islice
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.catalog import ingredients_catalog, tags_catalog
+from recipes.models import Ingredient, Tag
+
+READ_SIZE = 64 * 1024
+CATALOGS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit'),
+                    ingredients_catalog),
+    'tags': (Tag, ('name', 'color', 'slug'), tags_catalog),
+}
+
+
+def iter_json(file):
+    """
+    Читает объекты из JSON-массива или из JSON Lines по частям,
+    не загружая файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position == len(buffer) and eof:
+            return
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError(
+                    f'Некорректный JSON: {buffer[position:position + 100]}'
+                )
+            chunk = file.read(READ_SIZE)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        yield value
+
+
+def iter_json_rows(file, model, fields):
+    """
+    Строки справочника из JSON. Поддерживаются фикстуры Django
+    (как dump.json, объекты других моделей пропускаются)
+    и списки объектов с полями модели.
+    """
+    label = model._meta.label_lower
+    for value in iter_json(file):
+        if not isinstance(value, dict):
+            raise CommandError(f'Ожидался объект, получено: {value}')
+        if 'model' in value:
+            if value['model'] != label:
+                continue
+            value = value['fields']
+        yield tuple(value.get(field) for field in fields)
+
+
+def iter_csv_rows(file, fields):
+    """
+    Строки справочника из CSV. Заголовок необязателен: без него
+    колонки идут в порядке полей модели, с ним - в любом порядке,
+    пробелы вокруг названий колонок не учитываются.
+    """
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [column.strip() for column in first]
+    if not set(fields) <= set(header):
+        header = fields
+        yield tuple(first[:len(fields)])
+    positions = [header.index(field) for field in fields]
+    for row in reader:
+        if row:
+            yield tuple(row[position] for position in positions)
+
+
+def clean(rows):
+    for row in rows:
+        if all(row):
+            yield tuple(str(value).strip() for value in row)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт справочника ингредиентов или тегов из JSON '
+        '(в том числе dump.json) или CSV. Строки вставляются пачками, '
+        'уже существующие пропускаются, поэтому повторный запуск '
+        'ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON, JSON Lines или CSV.')
+        parser.add_argument(
+            '--catalog', choices=CATALOGS, default='ingredients',
+        )
+        parser.add_argument(
+            '--format', choices=('json', 'csv'),
+            help='Формат файла. По умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        model, fields, catalog = CATALOGS[options['catalog']]
+        file_format = options['format'] or (
+            'csv' if options['path'].lower().endswith('.csv') else 'json'
+        )
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        if model is Tag:
+            insert = self.upsert_tags
+        elif use_copy:
+            insert = self.copy_ingredients
+        else:
+            insert = self.insert_ingredients
+        before = model.objects.count()
+        started = perf_counter()
+        total = 0
+        with open(options['path'], encoding='utf-8-sig',
+                  newline='') as file:
+            if file_format == 'csv':
+                rows = iter_csv_rows(file, fields)
+            else:
+                rows = iter_json_rows(file, model, fields)
+            for chunk in chunked(clean(rows), options['chunk_size']):
+                with transaction.atomic():
+                    insert(chunk)
+                total += len(chunk)
+        elapsed = perf_counter() - started
+        catalog.bump()
+        self.stdout.write(self.style.SUCCESS(
+            f'{os.path.basename(options["path"])}: прочитано {total} строк, '
+            f'добавлено {model.objects.count() - before} '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с, '
+            f'{"COPY" if use_copy and model is Ingredient else "INSERT"}).'
+        ))
+
+    @staticmethod
+    def insert_ingredients(chunk):
+        """
+        Ограничение unique_ingredients охватывает все поля ингредиента,
+        поэтому при конфликте обновлять нечего и существующая строка
+        просто пропускается.
+        """
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in chunk),
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def copy_ingredients(chunk):
+        """
+        На PostgreSQL пачка загружается командой COPY во временную
+        таблицу и переносится в справочник одним INSERT ... SELECT.
+        """
+        table = Ingredient._meta.db_table
+        data = StringIO()
+        csv.writer(data).writerows(chunk)
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE import_ingredient '
+                '(name varchar(200), measurement_unit varchar(200))'
+            )
+            cursor.copy_expert(
+                'COPY import_ingredient (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                data,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM import_ingredient ON CONFLICT DO NOTHING'
+            )
+            # ON COMMIT DROP не сработал бы внутри внешней транзакции,
+            # и следующая пачка не смогла бы создать таблицу.
+            cursor.execute('DROP TABLE import_ingredient')
+
+    @staticmethod
+    def upsert_tags(chunk):
+        """
+        Тегов единицы, поэтому они обновляются по слагу по одному:
+        так повторный импорт меняет название и цвет существующего тега.
+        """
+        for name, color, slug in chunk:
+            Tag.objects.update_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import has_actual_variants, make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Готовит уменьшенные копии картинок для рецептов, у которых '
+        'их нет или они устарели.'
+    )
+
+    def handle(self, *args, **options):
+        done = 0
+        for recipe in Recipe.objects.exclude(image='').iterator():
+            if has_actual_variants(recipe):
+                continue
+            try:
+                make_variants(recipe.pk)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Подготовлены картинки для рецептов: {done}.'
+        ))
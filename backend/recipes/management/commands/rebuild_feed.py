@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересоздает ленты подписок по текущим подпискам и рецептам. '
+        'Нужна после загрузки данных без сигналов (loaddata, bulk_create).'
+    )
+
+    def handle(self, *args, **options):
+        FeedItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {FeedItem.objects.count()}.'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересоздает сводные списки покупок пользователей по содержимому '
+        'корзин. С флагом --check только сверяет сохраненные итоги.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить списки покупок, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            ShoppingListItem.objects.rebuild()
+        extra, missing = ShoppingListItem.objects.verify()
+        for user_id, ingredient_id, amount in sorted(extra):
+            self.stderr.write(
+                f'Лишняя запись: пользователь {user_id}, '
+                f'ингредиент {ingredient_id}, количество {amount}'
+            )
+        for user_id, ingredient_id, amount in sorted(missing):
+            self.stderr.write(
+                f'Нет записи: пользователь {user_id}, '
+                f'ингредиент {ingredient_id}, количество {amount}'
+            )
+        if extra or missing:
+            raise CommandError(
+                f'Списки покупок расходятся с корзинами: '
+                f'{len(extra) + len(missing)} расхождений.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок совпадают с корзинами пользователей.'
+        ))
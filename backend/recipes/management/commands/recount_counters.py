@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает хранимые счетчики избранного, списков покупок, '
+        'рецептов и подписчиков. С флагом --check только сверяет их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить счетчики, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, field, related, key in COUNTERS:
+            mismatched = recount(
+                model, field, related, key, check=options['check']
+            )
+            if mismatched:
+                self.stderr.write(
+                    f'{model.__name__}.{field}: расхождений {mismatched}'
+                )
+            total += mismatched
+        if total and options['check']:
+            raise CommandError(
+                f'Счетчики расходятся с данными: {total} расхождений.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: {total}.' if total
+            else 'Счетчики совпадают с данными.'
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:58
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'carts_count', 'ShoppingCart', 'recipe'),
+    ('users', 'CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'CustomUser', 'followers_count', 'Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, related, key in COUNTERS:
+        related = apps.get_model(
+            'users' if related == 'Follow' else 'recipes', related
+        )
+        total = related.objects.filter(
+            **{key: models.OuterRef('pk')}
+        ).order_by().values(key).annotate(
+            total=models.Count('pk')
+        ).values('total')
+        apps.get_model(app, model).objects.update(
+            **{field: Coalesce(models.Subquery(total), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20261018_0158'),
+        ('recipes', '0006_auto_20261018_0145'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:02
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', replace(name, 'ё', 'е')), 'A') || "
+    "setweight(to_tsvector('russian', replace(text, 'ё', 'е')), 'B')",
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING gin (search_vector)',
+)
+POSTGRES_BACKWARD = ('DROP INDEX IF EXISTS recipe_search_vector_idx',)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, text, tokenize = 'unicode61 remove_diacritics 2')",
+)
+SQLITE_BACKWARD = ('DROP TABLE IF EXISTS recipes_recipe_fts',)
+
+
+def execute(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        execute(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        execute(schema_editor, SQLITE_FORWARD)
+        Recipe = apps.get_model('recipes', 'Recipe')
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+                'VALUES (%s, %s, %s)',
+                [(pk, name.casefold().replace('ё', 'е'),
+                  text.casefold().replace('ё', 'е'))
+                 for pk, name, text
+                 in Recipe.objects.values_list('pk', 'name', 'text')],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        execute(schema_editor, POSTGRES_BACKWARD)
+    elif vendor == 'sqlite':
+        execute(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_auto_20261018_0158'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
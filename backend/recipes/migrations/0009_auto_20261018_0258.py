@@ -0,0 +1,60 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from foodgram.settings import FEED_BACKFILL_LIMIT
+
+FILL_FEED = (
+    'INSERT INTO recipes_feeditem (user_id, recipe_id, author_id, pub_date) '
+    'SELECT follow.user_id, recipe.id, recipe.author_id, recipe.pub_date '
+    'FROM users_follow follow '
+    'JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+    'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+    ') AS number FROM recipes_recipe) recipe '
+    'ON recipe.author_id = follow.author_id '
+    'WHERE recipe.number <= %s'
+)
+
+
+def fill_feed(apps, schema_editor):
+    schema_editor.execute(FILL_FEED, (FEED_BACKFILL_LIMIT,))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20261018_0158'),
+        ('recipes', '0008_auto_20261018_0202'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followers_feed', to='users.CustomUser', verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to='users.CustomUser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+                'ordering': ('-pub_date', '-id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-id'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
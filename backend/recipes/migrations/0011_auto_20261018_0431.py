@@ -0,0 +1,33 @@
+# Generated by Django 2.2.19 on 2026-10-18 04:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    ShoppingListJob = apps.get_model('recipes', 'ShoppingListJob')
+    active = ShoppingListJob.objects.filter(status__in=ACTIVE_STATUSES)
+    duplicates = active.values('user_id').annotate(
+        count=Count('id'), first=Min('id')
+    ).filter(count__gt=1)
+    for duplicate in duplicates:
+        active.filter(user_id=duplicate['user_id']).exclude(
+            pk=duplicate['first']
+        ).update(status='failed', error='Повторная задача пользователя.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_auto_20261018_0310'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shoppinglistjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=('pending', 'running')), fields=('user',), name='unique_active_shopping_list_job'),
+        ),
+    ]
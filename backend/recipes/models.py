@@ -1,8 +1,15 @@
+from contextlib import contextmanager
+from threading import local
+
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
 from colorfield.fields import ColorField
 
-from users.models import CustomUser
+from foodgram.settings import FEED_BACKFILL_LIMIT
+from users.models import CustomUser, Follow
 
 
 # Длина поля слаг была указана 200 символов в соотвествии с ТЗ(Redoc). Убрал.
@@ -68,6 +75,18 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название рецепта', max_length=200,)
     image = models.ImageField('Картинка рецепта', upload_to='recipes/')
+    image_card = models.ImageField(
+        'Картинка для карточки рецепта',
+        upload_to='recipes/card/',
+        blank=True,
+        editable=False,
+    )
+    image_detail = models.ImageField(
+        'Картинка для страницы рецепта',
+        upload_to='recipes/detail/',
+        blank=True,
+        editable=False,
+    )
     text = models.TextField('Описание рецепта',)
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -90,11 +109,26 @@ class Recipe(models.Model):
         ),
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False,
+    )
+    carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок', default=0, editable=False,
+    )
+    # Заполняется только на PostgreSQL, в SQLite для поиска
+    # используется отдельная таблица FTS5.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -206,3 +240,398 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в списке избранного {self.user}.'
+
+
+class FeedItemManager(models.Manager):
+    """
+    Ленты подписок заполняются при записи: новый рецепт сразу
+    раскладывается по лентам всех подписчиков автора, поэтому чтение
+    ленты - это один проход по индексу (user, pub_date, id).
+    """
+    def add_recipe(self, recipe):
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe.id,
+                        author_id=recipe.author_id, pub_date=recipe.pub_date)
+             for user_id in followers),
+            ignore_conflicts=True,
+        )
+
+    def add_follow(self, user_id, author_id):
+        """
+        Добавляет в ленту новые рецепты автора, на которого подписался
+        пользователь. Старые рецепты плодовитых авторов не копируются:
+        их не больше FEED_BACKFILL_LIMIT.
+        """
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:FEED_BACKFILL_LIMIT]
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe_id,
+                        author_id=author_id, pub_date=pub_date)
+             for recipe_id, pub_date in recipes),
+            ignore_conflicts=True,
+        )
+
+    def remove_follow(self, user_id, author_id):
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        """
+        Полностью пересоздает ленты по подпискам одним INSERT ... SELECT:
+        каждому подписчику достаются последние FEED_BACKFILL_LIMIT
+        рецептов автора, как при подписке.
+        """
+        self.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, recipe_id, author_id, pub_date) '
+                f'SELECT follow.user_id, recipe.id, recipe.author_id, '
+                f'recipe.pub_date '
+                f'FROM {Follow._meta.db_table} follow '
+                f'JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+                f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+                f') AS number FROM {Recipe._meta.db_table}) recipe '
+                f'ON recipe.author_id = follow.author_id '
+                f'WHERE recipe.number <= %s',
+                (FEED_BACKFILL_LIMIT,),
+            )
+
+
+class FeedItem(models.Model):
+    """
+    Модель записи в ленте подписок: рецепт автора, на которого
+    подписан пользователь. Автор и дата публикации рецепта
+    продублированы, чтобы лента читалась и чистилась по индексам
+    этой таблицы без соединения с рецептами.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='followers_feed',
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+    objects = FeedItemManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-id'),
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'), name='feed_user_author_idx'
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe',),
+                name='unique_feed_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}.'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Модель похожего рецепта: один из ближайших соседей рецепта
+    по составу ингредиентов. Списки соседей считаются заранее
+    (recipes.similarity) и хранятся уже отсортированными по оценке.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство по ингредиентам')
+    common_tags = models.PositiveSmallIntegerField('Общих тегов')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score', '-common_tags', '-similar')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar',),
+                name='unique_similar_recipe'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}.'
+
+
+class ShoppingListBatch:
+    def __init__(self):
+        self.deltas = {}
+        self.cart_users = {}
+
+
+# Незавершенный пакет изменений списков покупок текущего потока.
+pending = local()
+
+
+class ShoppingListItemManager(models.Manager):
+    """
+    Поддерживает сводный список покупок пользователей в актуальном
+    состоянии: при изменении корзины или рецепта к итоговым количествам
+    прибавляется (или вычитается) только разница. Методы вызываются
+    из сигналов корзин и ингредиентов рецептов; массовые операции,
+    которые сигналов не отправляют, вызывают change_recipe сами.
+    """
+    def calculate(self):
+        """
+        Заново считает итоговые количества по рецептам в корзинах.
+        Возвращает кортежи (пользователь, ингредиент, количество).
+        """
+        return IngredientAmount.objects.filter(
+            recipe__carts__isnull=False
+        ).values_list(
+            'recipe__carts__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    @transaction.atomic
+    def apply(self, user_ids, deltas):
+        """
+        Изменяет количества ингредиентов из словаря deltas
+        (ингредиент -> разница) в списках покупок пользователей.
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not user_ids or not deltas:
+            return
+        # Блокировка пользователей не дает параллельным запросам
+        # одновременно вставить одну и ту же позицию списка.
+        list(CustomUser.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        items.update(amount=Greatest(
+            F('amount') + Case(
+                *(When(ingredient_id=key, then=Value(value))
+                  for key, value in deltas.items()),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ))
+        self.bulk_create(
+            self.model(user_id=user_id, ingredient_id=key, amount=value)
+            for user_id in user_ids
+            for key, value in deltas.items()
+            if value > 0 and (user_id, key) not in existing
+        )
+        items.filter(amount=0).delete()
+
+    @contextmanager
+    def batch(self):
+        """
+        Внутри блока изменения списков покупок копятся в памяти и в конце
+        записываются одним вызовом apply на каждую группу пользователей
+        с одинаковой разницей, а не отдельно на каждую строку рецепта.
+        """
+        if getattr(pending, 'batch', None) is not None:
+            yield
+            return
+        pending.batch = ShoppingListBatch()
+        try:
+            with transaction.atomic():
+                yield
+                groups = {}
+                for user_id, deltas in pending.batch.deltas.items():
+                    key = frozenset(
+                        (ingredient_id, value)
+                        for ingredient_id, value in deltas.items() if value
+                    )
+                    groups.setdefault(key, []).append(user_id)
+                for deltas, user_ids in groups.items():
+                    self.apply(user_ids, dict(deltas))
+        finally:
+            pending.batch = None
+
+    def change(self, user_ids, deltas):
+        batch = getattr(pending, 'batch', None)
+        if batch is None:
+            self.apply(user_ids, deltas)
+            return
+        for user_id in user_ids:
+            totals = batch.deltas.setdefault(user_id, {})
+            for key, value in deltas.items():
+                totals[key] = totals.get(key, 0) + value
+
+    def get_cart_users(self, recipe_id):
+        # Внутри пакета владельцы корзин читаются один раз на рецепт:
+        # корзины, удаленные позже в том же пакете, вычитают состав
+        # рецепта сами.
+        batch = getattr(pending, 'batch', None)
+        if batch is not None and recipe_id in batch.cart_users:
+            return batch.cart_users[recipe_id]
+        user_ids = list(ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True))
+        if batch is not None:
+            batch.cart_users[recipe_id] = user_ids
+        return user_ids
+
+    def add_recipe(self, user_id, recipe_id):
+        self.change([user_id], self.get_recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        amounts = self.get_recipe_amounts(recipe_id)
+        self.change([user_id], {key: -value for key, value in amounts.items()})
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """
+        Переносит изменение ингредиентов рецепта в списки покупок
+        всех пользователей, у которых рецепт лежит в корзине.
+        """
+        deltas = {
+            key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+            for key in old_amounts.keys() | new_amounts.keys()
+        }
+        if any(deltas.values()):
+            self.change(self.get_cart_users(recipe_id), deltas)
+
+    @staticmethod
+    def get_recipe_amounts(recipe_id):
+        return dict(IngredientAmount.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'))
+
+    @transaction.atomic
+    def rebuild(self):
+        """
+        Полностью пересоздает списки покупок по содержимому корзин.
+        """
+        self.all().delete()
+        self.bulk_create(
+            (self.model(user_id=user_id, ingredient_id=key, amount=total)
+             for user_id, key, total in self.calculate())
+        )
+
+    def verify(self):
+        """
+        Сравнивает сохраненные списки покупок с пересчитанными заново.
+        Возвращает множества лишних и недостающих записей.
+        """
+        stored = set(self.values_list('user_id', 'ingredient_id', 'amount'))
+        expected = set(self.calculate())
+        return stored - expected, expected - stored
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель сводного списка покупок: суммарное количество ингредиента
+    во всех рецептах из корзины пользователя.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество ингредиента')
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        ordering = ('-id',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient',),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок {self.user}.'
+
+
+class ShoppingListJob(models.Model):
+    """
+    Задача на подготовку PDF со списком покупок пользователя.
+    Задачи хранятся в базе и выполняются фоновыми потоками.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_jobs',
+        verbose_name='Пользователь',
+    )
+    status = models.CharField(
+        'Статус', max_length=16, choices=STATUSES, default=PENDING
+    )
+    file = models.FileField(
+        'Файл списка покупок', upload_to='shopping_lists/', blank=True
+    )
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+    started = models.DateTimeField('Дата запуска', null=True, blank=True)
+    finished = models.DateTimeField('Дата завершения', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задача на список покупок'
+        verbose_name_plural = 'Задачи на списки покупок'
+        ordering = ('-id',)
+        indexes = (
+            models.Index(
+                fields=('status', 'created'), name='shopping_job_queue_idx'
+            ),
+        )
+        # У пользователя не больше одной невыполненной задачи.
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user',),
+                condition=models.Q(status__in=('pending', 'running')),
+                name='unique_active_shopping_list_job'
+            ),
+        )
+
+    def __str__(self):
+        return f'Список покупок {self.user} ({self.status}).'
@@ -0,0 +1,35 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Постраничный вывод для больших таблиц в админке. На PostgreSQL
+    количество строк берется из оценки планировщика (EXPLAIN), и только
+    если оценка меньше threshold, выполняется точный COUNT(*).
+    """
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        estimate = self.estimate(connection, queryset)
+        if estimate < self.threshold:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate(connection, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,224 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Lock
+
+import numpy as np
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from foodgram.settings import PANTRY_REBUILD_INTERVAL
+from .catalog import CATALOG_CACHE
+from .models import IngredientAmount
+from .similarity import read_pairs
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'pantry-version'
+# Битовое множество на n рецептов занимает n / 8 байт, массив номеров
+# рецептов - 4 байта на рецепт. Ингредиенты, которые есть больше чем
+# в 1/32 рецептов, хранятся битовыми множествами, остальные - массивами.
+DENSE_SHARE = 1 / 32
+
+
+class PantryIndex:
+    """
+    Обратный индекс ингредиент -> множество рецептов, в которых он есть.
+    Рецепты пронумерованы в порядке id, множества частых ингредиентов
+    хранятся битовыми строками, редких - отсортированными массивами
+    номеров. Индекс не изменяется после построения.
+    """
+    def __init__(self, pairs):
+        self.ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        self.sizes = np.bincount(rows, minlength=len(self.ids))
+        ingredients, columns = np.unique(pairs[:, 1], return_inverse=True)
+        order = np.argsort(columns, kind='stable')
+        bounds = np.searchsorted(
+            columns[order], np.arange(len(ingredients) + 1)
+        )
+        self.dense, self.sparse = {}, {}
+        for number, ingredient_id in enumerate(ingredients.tolist()):
+            recipes = rows[order[bounds[number]:bounds[number + 1]]]
+            if len(recipes) > DENSE_SHARE * len(self.ids):
+                bits = np.zeros(len(self.ids), dtype=bool)
+                bits[recipes] = True
+                self.dense[ingredient_id] = np.packbits(bits)
+            else:
+                self.sparse[ingredient_id] = recipes.astype(np.int32)
+
+    def count(self, ingredient_ids):
+        """
+        Сколько ингредиентов из ingredient_ids есть в каждом рецепте.
+        """
+        counts = np.zeros(len(self.ids), dtype=np.int32)
+        sparse = []
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in self.dense:
+                counts += np.unpackbits(
+                    self.dense[ingredient_id], count=len(self.ids)
+                )
+            elif ingredient_id in self.sparse:
+                sparse.append(self.sparse[ingredient_id])
+        if sparse:
+            counts += np.bincount(
+                np.concatenate(sparse), minlength=len(self.ids)
+            ).astype(np.int32)
+        return counts
+
+
+def get_version():
+    return caches[CATALOG_CACHE].get(VERSION_KEY)
+
+
+def top(ids, owned, sizes, limit):
+    """
+    Первые limit рецептов по доле имеющихся ингредиентов, затем
+    по их числу, затем более новые.
+    """
+    coverage = owned / sizes
+    if len(coverage) > limit:
+        # Точная сортировка нужна только рецептам не хуже limit-го.
+        threshold = np.partition(coverage, len(coverage) - limit)[-limit]
+        keep = coverage >= threshold
+        ids, owned, sizes = ids[keep], owned[keep], sizes[keep]
+        coverage = coverage[keep]
+    order = np.lexsort((-ids, -owned, -coverage))[:limit]
+    return list(zip(ids[order].tolist(), coverage[order].tolist(),
+                    owned[order].tolist(), sizes[order].tolist()))
+
+
+class Pantry:
+    """
+    Подбор рецептов по ингредиентам, которые есть у пользователя.
+    Каждый процесс держит свой индекс. Рецепты, измененные в этом
+    процессе, учитываются сразу: их состав хранится отдельно от индекса
+    и заменяет индексный. Об изменениях в других процессах сообщает
+    версия в общем кэше, тогда индекс перестраивается в фоновом потоке
+    не чаще раза в PANTRY_REBUILD_INTERVAL секунд, а запросы пока
+    обслуживает прежний индекс.
+    """
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.built = 0
+        self.changes = {}
+        self.sequence = count(1)
+        self.lock = Lock()
+        self.build_lock = Lock()
+        self.rebuilding = False
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='pantry'
+        )
+
+    def build(self):
+        """
+        Строит новый индекс. Вызывается под build_lock.
+        """
+        started = time.monotonic()
+        version = get_version()
+        last_change = next(self.sequence)
+        index = PantryIndex(read_pairs(
+            IngredientAmount.objects.all(),
+            ('recipe_id', 'ingredient_id'),
+        ))
+        with self.lock:
+            self.index, self.version = index, version
+            self.built = started
+            # Изменения, записанные до начала чтения, уже в индексе.
+            self.changes = {
+                recipe_id: change
+                for recipe_id, change in self.changes.items()
+                if change[0] > last_change
+            }
+
+    def is_stale(self):
+        return (
+            time.monotonic() - self.built > PANTRY_REBUILD_INTERVAL
+            and get_version() != self.version
+        )
+
+    def load(self):
+        """
+        Возвращает индекс и рецепты, измененные после его построения.
+        """
+        if self.index is None:
+            with self.build_lock:
+                if self.index is None:
+                    self.build()
+        elif self.is_stale():
+            with self.lock:
+                submit = not self.rebuilding
+                self.rebuilding = True
+            if submit:
+                self.executor.submit(self.rebuild_in_thread)
+        with self.lock:
+            return self.index, dict(self.changes)
+
+    def rebuild_in_thread(self):
+        try:
+            with self.build_lock:
+                self.build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс ингредиентов')
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def warm_up(self):
+        """
+        Строит индекс в фоновом потоке при запуске воркера, чтобы первый
+        запрос не ждал построения.
+        """
+        self.executor.submit(self.rebuild_in_thread)
+
+    def search(self, ingredient_ids, limit):
+        """
+        Рецепты с наибольшей долей ингредиентов из ingredient_ids.
+        Возвращает кортежи (id рецепта, доля, имеющихся ингредиентов,
+        всего ингредиентов).
+        """
+        ingredient_ids = set(ingredient_ids)
+        index, changes = self.load()
+        counts = index.count(ingredient_ids)
+        if changes:
+            counts[np.isin(index.ids, list(changes))] = 0
+        rows = np.flatnonzero(counts)
+        ids, owned, sizes = index.ids[rows], counts[rows], index.sizes[rows]
+        changed = [
+            (recipe_id, len(ingredients & ingredient_ids), len(ingredients))
+            for recipe_id, (_, ingredients) in changes.items()
+            if ingredients & ingredient_ids
+        ]
+        if changed:
+            extra = np.array(changed, dtype=np.int64)
+            ids = np.concatenate((ids, extra[:, 0]))
+            owned = np.concatenate((owned, extra[:, 1]))
+            sizes = np.concatenate((sizes, extra[:, 2]))
+        return top(ids, owned, sizes, limit)
+
+    def update_recipe(self, recipe_id):
+        """
+        Запоминает новый состав рецепта (пустой - если рецепт удален)
+        и сообщает остальным процессам, что их индексы устарели.
+        """
+        if self.index is not None or self.build_lock.locked():
+            ingredients = frozenset(IngredientAmount.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', flat=True))
+            with self.lock:
+                self.changes[recipe_id] = (next(self.sequence), ingredients)
+        self.bump()
+
+    @staticmethod
+    def bump():
+        """
+        Сообщает всем процессам, что их индексы устарели.
+        """
+        caches[CATALOG_CACHE].set(VERSION_KEY, time.time())
+
+    def schedule_update(self, recipe_id):
+        transaction.on_commit(lambda: self.update_recipe(recipe_id))
+
+
+pantry = Pantry()
@@ -0,0 +1,127 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Replace
+
+from .catalog import normalize
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса полей в bm25 для SQLite: совпадение в названии важнее.
+FTS_WEIGHTS = (10.0, 1.0)
+# Короткие слова ищутся целиком, у длинных отбрасывается окончание.
+STEM_MIN_LENGTH = 4
+STEM_CUT = 2
+WORD = re.compile(r'\w+')
+
+
+def get_search_vector():
+    """
+    Поисковый вектор PostgreSQL: название важнее описания,
+    слова приводятся к основе русским стеммером.
+    """
+    return (
+        SearchVector(
+            Replace('name', Value('ё'), Value('е')),
+            weight='A', config=SEARCH_CONFIG,
+        )
+        + SearchVector(
+            Replace('text', Value('ё'), Value('е')),
+            weight='B', config=SEARCH_CONFIG,
+        )
+    )
+
+
+def get_fts_query(value):
+    """
+    Запрос FTS5 из слов пользователя. В SQLite нет русского
+    стеммера, поэтому у длинных слов отбрасывается окончание
+    и ищутся слова с таким началом.
+    """
+    terms = []
+    for word in WORD.findall(normalize(value)):
+        if len(word) > STEM_MIN_LENGTH:
+            word = word[:max(STEM_MIN_LENGTH, len(word) - STEM_CUT)]
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def update_search_index(recipe_ids):
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=get_search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        rows = Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', 'name', 'text')
+        delete_from_search_index(recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                f'VALUES (%s, %s, %s)',
+                [(pk, normalize(name), normalize(text))
+                 for pk, name, text in rows],
+            )
+
+
+def delete_from_search_index(recipe_ids):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in recipe_ids],
+        )
+
+
+def rebuild_search_index():
+    if connection.vendor == 'postgresql':
+        Recipe.objects.update(search_vector=get_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        update_search_index(Recipe.objects.values_list('pk', flat=True))
+
+
+def search_recipes(queryset, value):
+    """
+    Оставляет рецепты, подходящие под поисковую строку, и добавляет
+    аннотацию rank - релевантность, чем больше, тем выше в выдаче.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value.replace('ё', 'е'), config=SEARCH_CONFIG
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+    if connection.vendor == 'sqlite':
+        query = get_fts_query(value)
+        if not query:
+            return queryset.none().annotate(
+                rank=Value(0.0, output_field=FloatField())
+            )
+        table = Recipe._meta.db_table
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # RawSQL в pk__in получает вторые скобки, и SQLite считает
+        # подзапрос скалярным, поэтому условие задается через extra.
+        return queryset.extra(
+            where=(
+                f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)',
+            ),
+            params=(query,),
+        ).annotate(rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            (query,), output_field=FloatField(),
+        ))
+    return queryset.filter(name__icontains=value).annotate(
+        rank=Value(0.0, output_field=FloatField())
+    )
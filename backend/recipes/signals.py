@@ -0,0 +1,182 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from users.models import Follow
+from .catalog import ingredients_catalog, tags_catalog
+from .counters import COUNTERS, change_counters
+from .images import VARIANT_FIELDS, has_actual_variants, schedule_variants
+from .models import (FeedItem, Ingredient, IngredientAmount, Recipe,
+                     ShoppingCart, ShoppingListItem, SimilarRecipe, Tag)
+from .pantry import pantry
+from .search import delete_from_search_index, update_search_index
+from .similarity import schedule_refresh
+
+SEARCH_FIELDS = {'name', 'text'}
+CATALOGS = {Tag: tags_catalog, Ingredient: ingredients_catalog}
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_recipe_image_variants(instance, raw, update_fields, **kwargs):
+    if raw or not instance.image:
+        return
+    if update_fields and set(update_fields) <= set(VARIANT_FIELDS):
+        return
+    if not has_actual_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_index(instance, update_fields, **kwargs):
+    if update_fields and not SEARCH_FIELDS & set(update_fields):
+        return
+    update_search_index([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search_index(instance, **kwargs):
+    delete_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_similar_recipes(instance, raw, update_fields, **kwargs):
+    # Сохранение с update_fields не меняет состав рецепта, а теги
+    # и ингредиенты к этому моменту уже записаны той же транзакцией.
+    if raw or update_fields:
+        return
+    schedule_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def refresh_recipes_similar_to_deleted(instance, **kwargs):
+    schedule_refresh(SimilarRecipe.objects.filter(
+        similar=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def update_pantry_recipe(instance, raw, update_fields, **kwargs):
+    if raw or update_fields:
+        return
+    pantry.schedule_update(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_pantry_recipe(instance, **kwargs):
+    pantry.schedule_update(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(instance, created, raw, **kwargs):
+    if created and not raw:
+        FeedItem.objects.add_recipe(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(instance, created, raw, **kwargs):
+    if created and not raw:
+        FeedItem.objects.add_follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(instance, **kwargs):
+    FeedItem.objects.remove_follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(instance, created, raw, **kwargs):
+    if created and not raw:
+        ShoppingListItem.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(instance, **kwargs):
+    ShoppingListItem.objects.remove_recipe(
+        instance.user_id, instance.recipe_id
+    )
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_saved_amount(instance, raw, **kwargs):
+    instance.saved_amount = None
+    if not raw and instance.pk is not None:
+        instance.saved_amount = IngredientAmount.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def change_shopping_list_amount(instance, raw, **kwargs):
+    if raw:
+        return
+    old_amounts = {}
+    if instance.saved_amount is not None:
+        recipe_id, ingredient_id, amount = instance.saved_amount
+        if recipe_id == instance.recipe_id:
+            old_amounts = {ingredient_id: amount}
+        else:
+            ShoppingListItem.objects.change_recipe(
+                recipe_id, {ingredient_id: amount}, {}
+            )
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, old_amounts,
+        {instance.ingredient_id: instance.amount},
+    )
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def subtract_shopping_list_amount(instance, **kwargs):
+    # При удалении рецепта каскадом удаляются и его ингредиенты,
+    # и корзины с ним. Что бы ни удалилось раньше, состав вычитается
+    # ровно один раз: корзина вычитает оставшиеся ингредиенты,
+    # ингредиент - из оставшихся корзин.
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+    )
+
+
+# Состав рецепта меняют и в обход сохранения рецепта, например
+# в админке, поэтому похожие рецепты и индекс ингредиентов
+# обновляются и по изменениям самих ингредиентов.
+@receiver(post_save, sender=IngredientAmount)
+def update_recipe_composition(instance, raw, **kwargs):
+    if raw:
+        return
+    recipe_ids = {instance.recipe_id}
+    if instance.saved_amount is not None:
+        recipe_ids.add(instance.saved_amount[0])
+    schedule_refresh(recipe_ids)
+    for recipe_id in recipe_ids:
+        pantry.schedule_update(recipe_id)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def delete_recipe_composition(instance, **kwargs):
+    schedule_refresh([instance.recipe_id])
+    pantry.schedule_update(instance.recipe_id)
+
+
+def increase_counters(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_counters(sender, instance, 1)
+
+
+def decrease_counters(sender, instance, **kwargs):
+    change_counters(sender, instance, -1)
+
+
+for _, _, related, _ in COUNTERS:
+    post_save.connect(increase_counters, sender=related)
+    post_delete.connect(decrease_counters, sender=related)
+
+
+def bump_catalog(sender, **kwargs):
+    # Сохранения из loaddata (raw=True) тоже меняют справочник.
+    CATALOGS[sender].bump()
+
+
+for model in CATALOGS:
+    post_save.connect(bump_catalog, sender=model)
+    post_delete.connect(bump_catalog, sender=model)
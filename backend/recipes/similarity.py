@@ -0,0 +1,295 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from threading import Lock
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from scipy.sparse import csr_matrix
+
+from foodgram.settings import SIMILAR_RECIPES_COUNT
+from .models import IngredientAmount, Recipe, SimilarRecipe
+
+logger = logging.getLogger(__name__)
+
+# Сколько рецептов сравнивается со всеми остальными за одно умножение
+# матриц: больше - быстрее, но больше памяти на промежуточный результат.
+BLOCK_SIZE = 512
+READ_CHUNK_SIZE = 10000
+# Ингредиенты, которые есть в большей доле рецептов (и не меньше чем
+# в COMMON_MIN_RECIPES), не используются для поиска кандидатов: рецепты,
+# у которых общие только соль и мука, похожими не считаются, а перебор
+# пар через такие ингредиенты - почти все пары рецептов. В оценку
+# сходства они входят.
+COMMON_SHARE = 0.01
+COMMON_MIN_RECIPES = 1000
+# Число единичных битов в каждом возможном байте.
+BITS_IN_BYTE = np.array([bin(byte).count('1') for byte in range(256)],
+                        dtype=np.uint8)
+
+executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='similar-recipes'
+)
+pending = set()
+pending_lock = Lock()
+
+
+def read_pairs(queryset, fields):
+    """
+    Читает пары id из базы сразу в массив NumPy, без списка кортежей.
+    """
+    values = queryset.order_by().values_list(*fields).iterator(
+        chunk_size=READ_CHUNK_SIZE
+    )
+    return np.fromiter(chain.from_iterable(values), dtype=np.int64).reshape(
+        -1, 2
+    )
+
+
+def build_masks(rows, bits, size):
+    """
+    Битовые маски: в строке rows[i] установлен бит bits[i].
+    """
+    words = bits.max() // 64 + 1 if len(bits) else 1
+    masks = np.zeros((size, words), dtype=np.uint64)
+    np.bitwise_or.at(
+        masks,
+        (rows, bits // 64),
+        np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64)),
+    )
+    return masks
+
+
+def popcount(values):
+    """
+    Число единичных битов в каждой строке массива uint64.
+    """
+    values = np.ascontiguousarray(values)
+    # Ширина задается явно: при пустом values reshape(0, -1) невозможен.
+    return BITS_IN_BYTE[values.view(np.uint8)].reshape(
+        len(values), values.shape[1] * values.itemsize
+    ).sum(axis=1, dtype=np.int64)
+
+
+def get_common_limit(recipes_count):
+    return max(COMMON_SHARE * recipes_count, COMMON_MIN_RECIPES)
+
+
+class RecipeVectors:
+    """
+    Состав рецептов в виде разреженной матрицы рецепт x ингредиент
+    из нулей и единиц. Строки матрицы идут в порядке id рецептов,
+    рецепты без ингредиентов в нее не попадают. Частые ингредиенты
+    (common_ids) и теги рецептов хранятся битовыми масками.
+    """
+    def __init__(self, amounts, common_ids, tag_pairs):
+        self.ids, rows = np.unique(amounts[:, 0], return_inverse=True)
+        ingredients, columns = np.unique(amounts[:, 1], return_inverse=True)
+        self.sizes = np.bincount(rows, minlength=len(self.ids))
+        common = np.isin(amounts[:, 1], common_ids)
+        _, common_bits = np.unique(columns[common], return_inverse=True)
+        self.common = build_masks(
+            rows[common], common_bits, len(self.ids)
+        )
+        self.matrix = csr_matrix(
+            (np.ones((~common).sum(), dtype=np.float32),
+             (rows[~common], columns[~common])),
+            shape=(len(self.ids), len(ingredients)),
+        )
+        self.transposed = self.matrix.T.tocsr()
+        self.tags = self.get_tag_masks(tag_pairs)
+
+    @classmethod
+    def load(cls):
+        """
+        Все рецепты: для полного пересчета.
+        """
+        amounts = read_pairs(
+            IngredientAmount.objects.all(), ('recipe_id', 'ingredient_id')
+        )
+        ingredient_ids, counts = np.unique(amounts[:, 1], return_counts=True)
+        limit = get_common_limit(len(np.unique(amounts[:, 0])))
+        return cls(amounts, ingredient_ids[counts > limit], read_pairs(
+            Recipe.tags.through.objects.all(), ('recipe_id', 'tag_id')
+        ))
+
+    @classmethod
+    def load_around(cls, recipe_ids):
+        """
+        Только рецепты recipe_ids и их кандидаты в соседи - рецепты
+        с общим нечастым ингредиентом. Частота считается лишь для
+        ингредиентов recipe_ids, а из таблицы читается состав одних
+        кандидатов, поэтому объем чтения зависит от числа соседей,
+        а не от числа всех рецептов.
+        """
+        recipe_ids = list(recipe_ids)
+        own = IngredientAmount.objects.filter(recipe_id__in=recipe_ids)
+        limit = get_common_limit(Recipe.objects.count())
+        common_ids = [
+            ingredient_id
+            for ingredient_id, used in IngredientAmount.objects.filter(
+                ingredient_id__in=own.values('ingredient_id')
+            ).values_list('ingredient_id').annotate(Count('id')).order_by()
+            if used > limit
+        ]
+        candidates = IngredientAmount.objects.filter(
+            ingredient_id__in=own.exclude(
+                ingredient_id__in=common_ids
+            ).values('ingredient_id')
+        ).values('recipe_id')
+        nearby = Q(recipe_id__in=recipe_ids) | Q(recipe_id__in=candidates)
+        return cls(
+            read_pairs(IngredientAmount.objects.filter(nearby),
+                       ('recipe_id', 'ingredient_id')),
+            common_ids,
+            read_pairs(Recipe.tags.through.objects.filter(nearby),
+                       ('recipe_id', 'tag_id')),
+        )
+
+    def get_tag_masks(self, pairs):
+        pairs = pairs[np.isin(pairs[:, 0], self.ids)]
+        _, bits = np.unique(pairs[:, 1], return_inverse=True)
+        return build_masks(
+            np.searchsorted(self.ids, pairs[:, 0]), bits, len(self.ids)
+        )
+
+    def get_rows(self, recipe_ids):
+        return np.flatnonzero(np.isin(self.ids, list(recipe_ids)))
+
+    def neighbours(self, rows, count):
+        """
+        Ближайшие соседи рецептов из строк rows. Сходство - коэффициент
+        Жаккара множеств ингредиентов: число общих ингредиентов делится
+        на число ингредиентов в обоих рецептах вместе. Кандидаты - рецепты
+        хотя бы с одним общим нечастым ингредиентом. При равном сходстве
+        выше рецепт с большим числом общих тегов, затем более новый.
+        Возвращает массивы id рецепта, id соседа, сходства и числа
+        общих тегов.
+        """
+        candidates = (self.matrix[rows] @ self.transposed).tocoo()
+        sources = rows[candidates.row]
+        keep = candidates.col != sources
+        block_rows, sources = candidates.row[keep], sources[keep]
+        targets = candidates.col[keep]
+        shared = candidates.data[keep].astype(np.int64) + popcount(
+            self.common[sources] & self.common[targets]
+        )
+        scores = shared / (self.sizes[sources] + self.sizes[targets] - shared)
+        # Одной сортировкой по сходству (сходство не больше 1, поэтому
+        # строки блока не перемешиваются) отбрасываются кандидаты хуже
+        # count-го в своей строке. Точный порядок с тегами и id
+        # считается только для оставшихся.
+        order = np.argsort(block_rows * 2 - scores)
+        ranked_rows = block_rows[order]
+        positions = np.arange(len(rows))
+        starts = np.searchsorted(ranked_rows, positions)
+        ends = np.searchsorted(ranked_rows, positions, side='right')
+        found = ends > starts
+        thresholds = np.full(len(rows), np.inf)
+        thresholds[found] = scores[order[
+            np.minimum(starts + count, ends)[found] - 1
+        ]]
+        keep = scores >= thresholds[block_rows]
+        block_rows, sources = block_rows[keep], sources[keep]
+        targets, scores = targets[keep], scores[keep]
+        tags = popcount(self.tags[sources] & self.tags[targets])
+        order = np.lexsort((-self.ids[targets], -tags, -scores, block_rows))
+        block_rows = block_rows[order]
+        starts = np.searchsorted(block_rows, positions)
+        order = order[np.arange(len(order)) - starts[block_rows] < count]
+        return (self.ids[sources[order]], self.ids[targets[order]],
+                scores[order], tags[order])
+
+    def iter_neighbours(self, rows, count):
+        for start in range(0, len(rows), BLOCK_SIZE):
+            yield self.neighbours(rows[start:start + BLOCK_SIZE], count)
+
+
+def save_neighbours(recipe_ids, blocks):
+    """
+    Заменяет списки похожих рецептов для recipe_ids новыми.
+    """
+    SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+    for sources, targets, scores, tags in blocks:
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=source, similar_id=target,
+                          score=score, common_tags=common_tags)
+            for source, target, score, common_tags in zip(
+                sources.tolist(), targets.tolist(),
+                scores.tolist(), tags.tolist(),
+            )
+        )
+
+
+def rebuild_similar(count=SIMILAR_RECIPES_COUNT):
+    """
+    Пересчитывает похожие рецепты для всех рецептов.
+    Возвращает число сохраненных пар.
+    """
+    vectors = RecipeVectors.load()
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        save_neighbours((), vectors.iter_neighbours(
+            np.arange(len(vectors.ids)), count
+        ))
+    return SimilarRecipe.objects.count()
+
+
+def refresh_similar(recipe_ids, count=SIMILAR_RECIPES_COUNT):
+    """
+    Пересчитывает похожие рецепты после изменения рецептов recipe_ids:
+    их собственные списки, списки рецептов, где они уже были соседями,
+    и списки их новых соседей - сходство симметрично, поэтому измененный
+    рецепт может войти и в их первую десятку. Остальные списки
+    уточнит следующий полный пересчет. Читается состав только этих
+    рецептов и их кандидатов в соседи, а не вся таблица.
+    """
+    recipe_ids = set(recipe_ids)
+    vectors = RecipeVectors.load_around(recipe_ids)
+    own = list(vectors.iter_neighbours(vectors.get_rows(recipe_ids), count))
+    affected = set(SimilarRecipe.objects.filter(
+        similar_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    for _, targets, _, _ in own:
+        affected.update(targets.tolist())
+    affected -= recipe_ids
+    if affected:
+        vectors = RecipeVectors.load_around(affected)
+        own = chain(
+            own, vectors.iter_neighbours(vectors.get_rows(affected), count)
+        )
+    with transaction.atomic():
+        save_neighbours(recipe_ids | affected, own)
+
+
+def run_refresh():
+    with pending_lock:
+        recipe_ids = set(pending)
+        pending.clear()
+    if not recipe_ids:
+        return
+    try:
+        refresh_similar(recipe_ids)
+    except Exception:
+        logger.exception(
+            'Не удалось обновить похожие рецепты для %s', sorted(recipe_ids)
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_refresh(recipe_ids):
+    """
+    Ставит пересчет в очередь после фиксации транзакции. Рецепты,
+    измененные пока идет пересчет, копятся и обрабатываются
+    следующим пересчетом одной пачкой.
+    """
+    recipe_ids = set(recipe_ids)
+
+    def submit():
+        with pending_lock:
+            pending.update(recipe_ids)
+        executor.submit(run_refresh)
+
+    transaction.on_commit(submit)
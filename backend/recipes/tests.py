@@ -0,0 +1,273 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from users.models import CustomUser
+from .images import make_variants
+from .pantry import Pantry
+from .models import Ingredient, IngredientAmount, Recipe, SimilarRecipe, Tag
+from .similarity import popcount, rebuild_similar, refresh_similar
+
+
+class ImportCatalogTest(TestCase):
+    """
+    Импорт справочников из CSV: на PostgreSQL ингредиенты
+    загружаются через COPY, на остальных базах - через INSERT.
+    """
+    def import_file(self, content, *args):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8', delete=False
+        ) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        output = StringIO()
+        call_command('import_catalog', file.name, *args, stdout=output)
+        return output.getvalue()
+
+    def get_ingredients(self):
+        return set(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+    def test_ingredients(self):
+        content = (
+            '\ufeff measurement_unit , name \n'
+            'г, соль\n'
+            'мл,молоко\n'
+            'г,соль\n'
+            ',пустая единица\n'
+        )
+        output = self.import_file(content)
+        method = 'COPY' if connection.vendor == 'postgresql' else 'INSERT'
+        self.assertIn(method, output)
+        expected = {('соль', 'г'), ('молоко', 'мл')}
+        self.assertEqual(self.get_ingredients(), expected)
+        self.import_file(content)
+        self.assertEqual(self.get_ingredients(), expected)
+
+    def test_ingredients_without_header(self):
+        self.import_file('соль,г\nмолоко,мл\n')
+        self.assertEqual(
+            self.get_ingredients(), {('соль', 'г'), ('молоко', 'мл')}
+        )
+
+    def test_tags(self):
+        self.import_file(
+            'slug, name, color\nbreakfast,Завтрак,#E26C2D\n',
+            '--catalog', 'tags',
+        )
+        self.import_file(
+            'slug, name, color\nbreakfast,Завтрак,#000000\n',
+            '--catalog', 'tags',
+        )
+        self.assertEqual(
+            list(Tag.objects.values_list('slug', 'name', 'color')),
+            [('breakfast', 'Завтрак', '#000000')],
+        )
+
+
+class SimilarRecipesTest(TestCase):
+    """
+    Пересчет похожих рецептов после правки дает те же списки, что
+    и полный пересчет, и не падает на рецептах без общих ингредиентов.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='test-password',
+        )
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(12)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {number}',
+                               color=f'#00000{number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.recipes = []
+        # Ингредиент 0 есть во всех рецептах, кроме последнего,
+        # у последнего нет общих ингредиентов ни с кем.
+        for number, used in enumerate(
+            ((0, 1, 2), (0, 1, 3), (0, 2, 3, 4), (0, 4, 5), (0, 5, 6, 7),
+             (0, 1, 7), (0, 6), (10, 11))
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png',
+            )
+            recipe.tags.set(tags[:number % 2 + 1])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredients[key],
+                                 amount=1)
+                for key in used
+            )
+            cls.recipes.append(recipe)
+
+    def get_lists(self):
+        return set(SimilarRecipe.objects.values_list(
+            'recipe_id', 'similar_id', 'score', 'common_tags'
+        ))
+
+    def test_popcount_empty(self):
+        values = np.zeros((0, 2), dtype=np.uint64)
+        self.assertEqual(popcount(values).tolist(), [])
+
+    def test_no_overlap(self):
+        lonely = self.recipes[-1]
+        refresh_similar([lonely.id], count=3)
+        self.assertFalse(SimilarRecipe.objects.filter(
+            recipe=lonely
+        ).exists())
+
+    def test_refresh_matches_rebuild(self):
+        # Ингредиент 0 становится частым и ищется через битовые маски.
+        for limit in (1000, 3):
+            with mock.patch('recipes.similarity.COMMON_MIN_RECIPES', limit):
+                rebuild_similar(count=3)
+                expected = self.get_lists()
+                SimilarRecipe.objects.all().delete()
+                refresh_similar(
+                    [recipe.id for recipe in self.recipes], count=3
+                )
+                self.assertEqual(self.get_lists(), expected)
+                refresh_similar([self.recipes[2].id], count=3)
+                self.assertEqual(self.get_lists(), expected)
+
+    def refresh_scheduled(self, schedule):
+        recipe_ids = set()
+        for call in schedule.call_args_list:
+            recipe_ids.update(call[0][0])
+        schedule.reset_mock()
+        refresh_similar(recipe_ids, count=3)
+        return recipe_ids
+
+    def test_ingredient_change(self):
+        # Состав меняется напрямую, без сохранения рецепта.
+        rebuild_similar(count=3)
+        lonely = self.recipes[-1]
+        amount = IngredientAmount.objects.get(
+            recipe=lonely, ingredient__name='Ингредиент 10'
+        )
+        with mock.patch('recipes.signals.schedule_refresh') as schedule:
+            amount.ingredient = Ingredient.objects.get(name='Ингредиент 6')
+            amount.save()
+            self.assertEqual(self.refresh_scheduled(schedule), {lonely.id})
+            self.assertEqual(
+                set(SimilarRecipe.objects.filter(
+                    recipe=lonely
+                ).values_list('similar_id', flat=True)),
+                {self.recipes[4].id, self.recipes[6].id},
+            )
+            refreshed = self.get_lists()
+            rebuild_similar(count=3)
+            self.assertEqual(self.get_lists(), refreshed)
+            amount.delete()
+            self.assertEqual(self.refresh_scheduled(schedule), {lonely.id})
+            self.assertFalse(SimilarRecipe.objects.filter(
+                recipe=lonely
+            ).exists())
+
+
+class PantryTest(TestCase):
+    """
+    Подбор по ингредиентам сразу учитывает ингредиенты рецепта,
+    измененные напрямую, без сохранения рецепта.
+    """
+    def test_ingredient_change(self):
+        author = CustomUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='test-password',
+        )
+        salt, milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'молоко')
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/test.png',
+        )
+        amount = IngredientAmount.objects.create(
+            recipe=recipe, ingredient=salt, amount=1
+        )
+        pantry = Pantry()
+        pantry.load()
+        # Тест идет в транзакции, поэтому изменения применяются сразу,
+        # а не после фиксации.
+        pantry.schedule_update = pantry.update_recipe
+        with mock.patch('recipes.signals.pantry', pantry):
+            amount.ingredient = milk
+            amount.save()
+            self.assertEqual(pantry.search({salt.id}, 10), [])
+            self.assertEqual(
+                [row[0] for row in pantry.search({milk.id}, 10)],
+                [recipe.id],
+            )
+            amount.delete()
+            self.assertEqual(pantry.search({milk.id}, 10), [])
+
+
+class RecipeImagesTest(TestCase):
+    """
+    Копии картинок разных рецептов не перезаписывают друг друга
+    даже при одинаковых именах, а копии замененной картинки удаляются.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.settings = override_settings(MEDIA_ROOT=cls.media)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def save_image(self, name, color):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def create_recipe(self, author, image):
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image=image,
+        )
+        make_variants(recipe.pk)
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_variants(self):
+        author = CustomUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='test-password',
+        )
+        first = self.create_recipe(
+            author, self.save_image('recipes/a/photo.png', 'red')
+        )
+        second = self.create_recipe(
+            author, self.save_image('recipes/b/photo.png', 'blue')
+        )
+        self.assertNotEqual(first.image_card.name, second.image_card.name)
+        old = first.image_card.name
+        first.image = self.save_image('recipes/other.png', 'green')
+        first.save()
+        make_variants(first.pk)
+        first.refresh_from_db()
+        self.assertTrue(default_storage.exists(first.image_card.name))
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(second.image_card.name))
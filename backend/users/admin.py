@@ -1,20 +1,25 @@
 from django.contrib import admin
 
 from foodgram.settings import EMPTY_FIELD
+from recipes.admin import LargeTableAdminMixin
 from .models import CustomUser, Follow
 
 
 @admin.register(CustomUser)
-class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'username', 'email', 'first_name', 'last_name',)
+class CustomUserAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'id', 'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count',
+    )
     search_fields = ('username', 'email',)
-    list_filter = ('username', 'email',)
+    list_filter = ('is_staff', 'is_active',)
     empty_value_display = EMPTY_FIELD
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'author',)
-    search_fields = ('user', 'author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author',)
+    search_fields = ('user__username', 'author__username',)
+    autocomplete_fields = ('user', 'author',)
     empty_value_display = EMPTY_FIELD
@@ -0,0 +1,135 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram.settings import AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TIMEOUT
+
+VERSION_CACHE = 'catalog'
+VERSION_KEY = 'auth-tokens-version'
+
+
+def get_fields(model):
+    return tuple(field.attname for field in model._meta.concrete_fields)
+
+
+def get_snapshot(instance):
+    return tuple(getattr(instance, name) for name in get_fields(instance))
+
+
+def from_snapshot(model, db, values):
+    """
+    Новый объект модели из сохраненных значений полей: каждый запрос
+    получает свою копию токена.
+    """
+    return model.from_db(db, get_fields(model), values)
+
+
+def get_version():
+    cache = caches[VERSION_CACHE]
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time())
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+class TokenCache:
+    """
+    Ограниченный по размеру и времени жизни кэш токенов в памяти
+    процесса, давно не использованные токены вытесняются первыми.
+    Записи действительны, пока не изменилась общая для всех
+    процессов версия: после выхода или удаления пользователя каждый
+    процесс очищает свой кэш.
+    """
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, version, value):
+        # Запись, прочитанная из базы до смены версии, уже устарела.
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TIMEOUT)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который не ищет токен в базе на каждый запрос,
+    а берет его из кэша процесса. Пользователь не кэшируется: он
+    читается по первичному ключу при каждом запросе, поэтому права,
+    блокировка и профиль всегда актуальны, а представления, которые
+    сохраняют request.user, не перезаписывают более новые данные.
+    """
+    def authenticate_credentials(self, key):
+        version = get_version()
+        cached = token_cache.get(key, version)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(
+                key, version, (token._state.db, get_snapshot(token))
+            )
+            return user, token
+        db, values = cached
+        model = self.get_model()
+        token = from_snapshot(model, db, values)
+        user = model.user.field.related_model._default_manager.using(
+            db
+        ).filter(pk=token.user_id).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        token.user = user
+        return user, token
+
+
+def invalidate_tokens(**kwargs):
+    """
+    Сбрасывает кэш токенов во всех процессах после фиксации транзакции.
+    Подключается к сигналу удаления токена. Удаление через
+    QuerySet.delete сигнал тоже отправляет, а токены удаленных
+    пользователей удаляются каскадом.
+    """
+    def bump():
+        token_cache.clear()
+        caches[VERSION_CACHE].set(VERSION_KEY, time.time())
+
+    transaction.on_commit(bump)
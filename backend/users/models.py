@@ -75,6 +75,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     is_admin = models.BooleanField(default=False)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False,
+    )
     objects = CustomUserManager()
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -87,6 +93,36 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user.loaded_values = dict(zip(field_names, values))
+        return user
+
+    def save(self, *args, update_fields=None, **kwargs):
+        super().save(*args, update_fields=update_fields, **kwargs)
+        saved = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (update_fields is None or field.name in update_fields)
+        }
+        self.loaded_values = {**getattr(self, 'loaded_values', {}), **saved}
+
+    def get_changed_fields(self, names, update_fields=None):
+        """
+        Какие из полей names изменились с момента чтения из базы или
+        последнего сохранения. Сигналы post_save вызывают его, чтобы
+        не сбрасывать кэши, когда нужные им поля не менялись.
+        """
+        if update_fields is not None:
+            names = set(names) & set(update_fields)
+        loaded = getattr(self, 'loaded_values', {})
+        return {
+            name for name in names
+            if name not in loaded or loaded[name] != getattr(self, name)
+        }
+
 
 class Follow(models.Model):
     """
@@ -110,6 +146,9 @@ class Follow(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ('-id',)
+        indexes = (
+            models.Index(fields=('user', '-id'), name='follow_user_id_idx'),
+        )
         constraints = (
             models.CheckConstraint(
                 check=~Q(user=F('author')),
@@ -1,8 +1,10 @@
+from django.db.models import OuterRef, Prefetch, Subquery
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api.cache import get_memberships
+from api.fields import RecipeImageField
 from recipes.models import Recipe
 from .models import CustomUser, Follow
 
@@ -55,10 +57,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user.id, author=obj.id).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return obj.id in memberships.following
 
 
 class SimplifyRecipeSerializer(serializers.ModelSerializer):
@@ -67,7 +67,7 @@ class SimplifyRecipeSerializer(serializers.ModelSerializer):
     краткого отображения сведений о рецептах пользователей,
     на которых подписан текущий пользователь.
     """
-    image = Base64ImageField()
+    image = RecipeImageField('card')
 
     class Meta:
         model = Recipe
@@ -100,18 +100,52 @@ class FollowSerializer(CustomUserSerializer):
             'recipes_count',
         )
 
+    @staticmethod
+    def get_recipes_limit(request):
+        limit = request.GET.get('recipes_limit', '')
+        return int(limit) if limit.isdigit() else None
+
+    @classmethod
+    def get_latest_recipes(cls, request):
+        """
+        Рецепты авторов, ограниченные recipes_limit последними рецептами
+        каждого автора. Ограничение выполняется коррелированным
+        подзапросом, поэтому рецепты всех авторов страницы
+        загружаются одним запросом.
+        """
+        queryset = Recipe.objects.order_by('-pub_date', '-id')
+        limit = cls.get_recipes_limit(request)
+        if limit is not None:
+            queryset = queryset.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values('pk')[:limit]
+            ))
+        return queryset
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request):
+        """
+        Подгружает для страницы подписок авторов и их последние
+        рецепты за фиксированное число запросов.
+        """
+        return queryset.select_related('author').prefetch_related(Prefetch(
+            'author__recipes',
+            queryset=cls.get_latest_recipes(request),
+            to_attr='latest_recipes',
+        ))
+
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        queryset = getattr(obj.author, 'latest_recipes', None)
+        if queryset is None:
+            queryset = self.get_latest_recipes(
+                self.context.get('request')
+            ).filter(author=obj.author)
         return SimplifyRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        # Сериализатор выводит подписки, поэтому подписка всегда есть.
+        return True
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+
+# Пользователь читается из базы на каждый запрос, поэтому кэш
+# сбрасывается только при удалении токена: при выходе из системы
+# и при удалении пользователя вместе с его токенами.
+post_delete.connect(invalidate_tokens, sender=Token)
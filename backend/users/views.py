@@ -58,7 +58,9 @@ class CustomUserViewSet(UserViewSet):
         methods=['GET'], detail=False, permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = Follow.objects.filter(user=request.user)
+        queryset = FollowSerializer.setup_eager_loading(
+            Follow.objects.filter(user=request.user), request
+        )
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages, many=True, context={'request': request}